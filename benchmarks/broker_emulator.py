@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+本地 Knative Broker 模拟器
+替代集群中的 broker-ingress，用于在单机上对 producer → broker → consumer 全链路做离线压测：
+
+- 接收 structured、binary 以及 batched（application/cloudevents-batch+json）三种模式的 CloudEvents
+- 按 Trigger 的 filter.attributes 匹配事件，使用属性索引而不是逐个 Trigger 线性扫描
+- 以 binary 模式投递给订阅者，支持 retry / backoffPolicy / backoffDelay / deadLetterSink
+  （与 knative-deadletter-best-practices.yaml 中的 delivery 配置语义一致）
+- 统计从进入 ingress 到成功投递的延迟，通过 GET /stats 查询
+
+示例:
+  python benchmarks/broker_emulator.py --port 8081 \\
+      --config infrastructure/knative/broker.yaml --config infrastructure/knative/trigger.yaml \\
+      --subscriber event-consumer-service=http://localhost:8080
+  BROKER_URL=http://localhost:8081/knative-demo/default python producer/src/main.py
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import queue
+import base64
+import signal
+import binascii
+import argparse
+import itertools
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+
+import requests
+
+from common import REPO_ROOT, percentile, write_report
+
+REQUIRED_ATTRIBUTES = ('specversion', 'id', 'source', 'type')
+DURATION_PATTERN = re.compile(
+    r'^P(?:(?P<days>\d+)D)?(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>[\d.]+)S)?)?$'
+)
+
+
+def parse_duration(value: Optional[str], default: float) -> float:
+    """解析 ISO 8601 时长（如 PT0.2S、PT1M），返回秒数"""
+    if not value:
+        return default
+    match = DURATION_PATTERN.match(value)
+    if not match:
+        raise ValueError(f'Invalid ISO 8601 duration: {value}')
+    parts = {k: float(v) for k, v in match.groupdict().items() if v}
+    return (parts.get('days', 0) * 86400 + parts.get('hours', 0) * 3600
+            + parts.get('minutes', 0) * 60 + parts.get('seconds', 0))
+
+
+class DeliverySpec:
+    """Trigger 的投递策略"""
+
+    def __init__(self, retry: int = 0, backoff_policy: str = 'exponential', backoff_delay: float = 0.2,
+                 dead_letter_sink: Optional[str] = None):
+        self.retry = retry
+        self.backoff_policy = backoff_policy
+        self.backoff_delay = backoff_delay
+        self.dead_letter_sink = dead_letter_sink
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试（从 1 开始）前的等待时间"""
+        if self.backoff_policy == 'linear':
+            return self.backoff_delay * attempt
+        return self.backoff_delay * (2 ** (attempt - 1))
+
+
+class Trigger:
+    def __init__(self, name: str, broker: str, filters: Dict[str, str], subscriber: str, delivery: DeliverySpec):
+        self.name = name
+        self.broker = broker
+        self.filters = filters
+        self.subscriber = subscriber
+        self.delivery = delivery
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        return all(event.get(attr) == value for attr, value in self.filters.items())
+
+
+class TriggerIndex:
+    """
+    Trigger 属性索引
+    每个 Trigger 选一个过滤属性（优先 type）作为索引键登记到 (broker, 属性, 值) 下，
+    匹配时只需对每个出现过的索引属性做一次字典查找，再校验候选 Trigger 的其余过滤条件；
+    没有过滤条件的 Trigger 匹配该 Broker 上的所有事件
+    """
+
+    def __init__(self, triggers: List[Trigger]):
+        self._indexed: Dict[Tuple[str, str, str], List[Trigger]] = defaultdict(list)
+        self._match_all: Dict[str, List[Trigger]] = defaultdict(list)
+        self._index_attrs: Dict[str, List[str]] = defaultdict(list)
+        for trigger in triggers:
+            if not trigger.filters:
+                self._match_all[trigger.broker].append(trigger)
+                continue
+            attr = 'type' if 'type' in trigger.filters else sorted(trigger.filters)[0]
+            self._indexed[(trigger.broker, attr, trigger.filters[attr])].append(trigger)
+            if attr not in self._index_attrs[trigger.broker]:
+                self._index_attrs[trigger.broker].append(attr)
+
+    def match(self, broker: str, event: Dict[str, Any]) -> List[Trigger]:
+        matched = list(self._match_all.get(broker, ()))
+        for attr in self._index_attrs.get(broker, ()):
+            value = event.get(attr)
+            if value is None:
+                continue
+            for trigger in self._indexed.get((broker, attr, value), ()):
+                if trigger.matches(event):
+                    matched.append(trigger)
+        return matched
+
+
+def load_triggers(paths: List[str], subscribers: Dict[str, str], default_delivery: DeliverySpec,
+                  namespace: Optional[str] = None) -> Tuple[List[Trigger], Dict[str, str]]:
+    """
+    从 Kubernetes YAML 中读取 Broker 与 Trigger
+    返回 (triggers, brokers)，brokers 为 Broker 名称到所属 namespace 的映射；
+    Service 类型的订阅者通过 subscribers（Service 名称 -> URL）解析
+    """
+    try:
+        import yaml
+    except ImportError:
+        sys.exit('PyYAML is required to load trigger definitions: pip install pyyaml')
+
+    def resolve(destination: Dict[str, Any]) -> Optional[str]:
+        if not destination:
+            return None
+        uri = destination.get('uri', '')
+        ref = destination.get('ref')
+        if not ref:
+            return uri or None
+        if ref.get('kind') == 'Broker':
+            return f"broker:{ref['name']}"
+        base = subscribers.get(ref['name'])
+        if base is None:
+            raise ValueError(f"No URL for subscriber {ref['name']}, pass --subscriber {ref['name']}=URL")
+        if uri and not uri.startswith('/'):
+            uri = '/' + uri
+        return base.rstrip('/') + uri
+
+    triggers, brokers = [], {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            documents = [doc for doc in yaml.safe_load_all(f) if doc]
+        for doc in documents:
+            meta = doc.get('metadata', {})
+            if namespace and meta.get('namespace') not in (None, namespace):
+                continue
+            if doc.get('kind') == 'Broker':
+                brokers[meta['name']] = meta.get('namespace', 'default')
+            elif doc.get('kind') == 'Trigger':
+                spec = doc.get('spec', {})
+                delivery = spec.get('delivery') or {}
+                triggers.append(Trigger(
+                    name=meta['name'],
+                    broker=spec.get('broker', 'default'),
+                    filters=(spec.get('filter') or {}).get('attributes') or {},
+                    subscriber=resolve(spec['subscriber']),
+                    delivery=DeliverySpec(
+                        retry=int(delivery.get('retry', default_delivery.retry)),
+                        backoff_policy=delivery.get('backoffPolicy', default_delivery.backoff_policy),
+                        backoff_delay=parse_duration(delivery.get('backoffDelay'), default_delivery.backoff_delay),
+                        dead_letter_sink=resolve(delivery.get('deadLetterSink')) or default_delivery.dead_letter_sink
+                    )
+                ))
+                brokers.setdefault(spec.get('broker', 'default'), meta.get('namespace', 'default'))
+    return triggers, brokers
+
+
+def parse_events(headers, body: bytes) -> List[Dict[str, Any]]:
+    """
+    按 CloudEvents HTTP 绑定解析请求，返回事件列表
+    事件以属性字典表示，data 保存为原始 bytes 或已解析的 JSON 对象
+    """
+    content_type = headers.get('Content-Type', '')
+    if content_type.startswith('application/cloudevents-batch+json'):
+        events = json.loads(body)
+        if not isinstance(events, list):
+            raise ValueError('Batched mode requires a JSON array')
+    elif content_type.startswith('application/cloudevents+json'):
+        events = [json.loads(body)]
+    else:
+        event = {key[3:].lower(): value for key, value in headers.items() if key.lower().startswith('ce-')}
+        if content_type:
+            event['datacontenttype'] = content_type
+        event['data'] = body
+        events = [event]
+
+    for event in events:
+        if not isinstance(event, dict):
+            raise ValueError('Each event must be a JSON object')
+        missing = [attr for attr in REQUIRED_ATTRIBUTES if not event.get(attr)]
+        if missing:
+            raise ValueError(f"Missing required attributes: {', '.join(missing)}")
+        if 'data_base64' in event:
+            # 在 ingress 校验，避免非法内容在投递时才失败
+            try:
+                base64.b64decode(event['data_base64'], validate=True)
+            except (binascii.Error, TypeError):
+                raise ValueError('data_base64 is not valid base64')
+    return events
+
+
+def to_binary(event: Dict[str, Any]) -> Tuple[Dict[str, str], bytes]:
+    """把事件转换为 binary 模式的 HTTP 请求（Knative broker 默认以 binary 模式投递）"""
+    headers = {}
+    for key, value in event.items():
+        if key in ('data', 'data_base64', 'datacontenttype'):
+            continue
+        headers['ce-' + key] = str(value)
+    headers['Content-Type'] = event.get('datacontenttype', 'application/json')
+
+    if 'data_base64' in event:
+        body = base64.b64decode(event['data_base64'])
+    else:
+        data = event.get('data')
+        if data is None:
+            body = b''
+        elif isinstance(data, bytes):
+            body = data
+        elif isinstance(data, str) and 'json' not in headers['Content-Type']:
+            body = data.encode()
+        else:
+            body = json.dumps(data).encode()
+    return headers, body
+
+
+class DeliveryStats:
+    """单个 Trigger 的投递统计；延迟样本保存在有界队列中，内存占用不随事件数增长"""
+
+    def __init__(self, max_samples: int = 100000):
+        self.delivered = 0
+        self.retries = 0
+        self.dead_lettered = 0
+        self.dropped = 0
+        # 投递过程中的非 HTTP 错误（如事件无法转换为请求）
+        self.errors = 0
+        self.latencies = deque(maxlen=max_samples)
+
+    def snapshot(self) -> Dict[str, Any]:
+        values = sorted(self.latencies)
+        return {
+            'delivered': self.delivered,
+            'retries': self.retries,
+            'dead_lettered': self.dead_lettered,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'latency_p50_ms': round(percentile(values, 50) * 1000, 3),
+            'latency_p99_ms': round(percentile(values, 99) * 1000, 3),
+            'latency_max_ms': round(values[-1] * 1000, 3) if values else 0.0
+        }
+
+
+class BrokerEmulator:
+    """Broker ingress + 投递引擎"""
+
+    def __init__(self, triggers: List[Trigger], brokers: Dict[str, str], workers: int = 32, timeout: float = 30):
+        self.index = TriggerIndex(triggers)
+        self.triggers = triggers
+        # ingress 路径 /<namespace>/<broker> -> broker 名称
+        self.routes = {f'/{ns}/{name}': name for name, ns in brokers.items()}
+        self.timeout = timeout
+        self.stats = {trigger.name: DeliveryStats() for trigger in triggers}
+        self.ingress = {'accepted': 0, 'rejected': 0, 'unmatched': 0}
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._retry_heap = []
+        # 堆中到期时间相同的条目按入堆顺序排列，不再比较后面的元素
+        self._retry_seq = itertools.count()
+        self._retry_cond = threading.Condition()
+        self._local = threading.local()
+        self._workers = workers
+        self._started = time.monotonic()
+
+    def start(self):
+        for i in range(self._workers):
+            threading.Thread(target=self._delivery_loop, name=f'delivery-{i}', daemon=True).start()
+        threading.Thread(target=self._retry_loop, name='retry-timer', daemon=True).start()
+
+    def ingest(self, broker: str, events: List[Dict[str, Any]], received_at: float):
+        """事件进入 broker：匹配 Trigger 并放入投递队列"""
+        for event in events:
+            matched = self.index.match(broker, event)
+            with self._stats_lock:
+                self.ingress['accepted'] += 1
+                if not matched:
+                    self.ingress['unmatched'] += 1
+            for trigger in matched:
+                self._queue.put((trigger, event, 0, received_at))
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _post(self, url: str, event: Dict[str, Any]) -> Tuple[int, bytes]:
+        headers, body = to_binary(event)
+        try:
+            response = self._session().post(url, headers=headers, data=body, timeout=self.timeout)
+            return response.status_code, response.content
+        except requests.RequestException as e:
+            return 0, str(e).encode()
+
+    def _delivery_loop(self):
+        """单个事件的任何异常都按投递失败处理（重试或死信），不会让投递线程退出"""
+        while True:
+            trigger, event, attempt, received_at = self._queue.get()
+            stats = self.stats[trigger.name]
+            try:
+                status, content = self._post(trigger.subscriber, event)
+            except Exception as e:
+                with self._stats_lock:
+                    stats.errors += 1
+                status, content = 0, f'{type(e).__name__}: {e}'.encode()
+            try:
+                self._complete(trigger, event, attempt, received_at, status, content, stats)
+            except Exception:
+                with self._stats_lock:
+                    stats.errors += 1
+                    stats.dropped += 1
+
+    def _complete(self, trigger: Trigger, event: Dict[str, Any], attempt: int, received_at: float,
+                  status: int, content: bytes, stats: DeliveryStats):
+        """根据投递结果记录成功、安排重试或投递死信"""
+        if 200 <= status < 300:
+            with self._stats_lock:
+                stats.delivered += 1
+                stats.latencies.append(time.monotonic() - received_at)
+        elif attempt < trigger.delivery.retry:
+            with self._stats_lock:
+                stats.retries += 1
+            due = time.monotonic() + trigger.delivery.backoff(attempt + 1)
+            with self._retry_cond:
+                heapq.heappush(self._retry_heap,
+                               (due, next(self._retry_seq), attempt + 1, trigger, event, received_at))
+                self._retry_cond.notify()
+        else:
+            self._dead_letter(trigger, event, status, content, stats)
+
+    def _dead_letter(self, trigger: Trigger, event: Dict[str, Any], status: int, content: bytes,
+                     stats: DeliveryStats):
+        """重试耗尽后发送到死信目标，并附加 Knative 的错误扩展属性"""
+        sink = trigger.delivery.dead_letter_sink
+        if not sink:
+            with self._stats_lock:
+                stats.dropped += 1
+            return
+
+        failed = dict(event)
+        failed['knativeerrordest'] = trigger.subscriber
+        failed['knativeerrorcode'] = str(status)
+        if content:
+            failed['knativeerrordata'] = base64.b64encode(content[:1024]).decode()
+
+        if sink.startswith('broker:'):
+            self.ingest(sink[len('broker:'):], [failed], time.monotonic())
+            ok = True
+        else:
+            status, _ = self._post(sink, failed)
+            ok = 200 <= status < 300
+        with self._stats_lock:
+            if ok:
+                stats.dead_lettered += 1
+            else:
+                stats.dropped += 1
+
+    def _retry_loop(self):
+        """把到期的重试重新放回投递队列，避免投递线程阻塞在退避等待上"""
+        while True:
+            with self._retry_cond:
+                while not self._retry_heap:
+                    self._retry_cond.wait()
+                due = self._retry_heap[0][0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._retry_cond.wait(timeout=delay)
+                    continue
+                _, _, attempt, trigger, event, received_at = heapq.heappop(self._retry_heap)
+            self._queue.put((trigger, event, attempt, received_at))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            triggers = {name: stats.snapshot() for name, stats in self.stats.items()}
+            ingress = dict(self.ingress)
+        with self._retry_cond:
+            pending_retries = len(self._retry_heap)
+        return {
+            'uptime_seconds': round(time.monotonic() - self._started, 2),
+            'ingress': ingress,
+            'queue_depth': self._queue.qsize(),
+            'pending_retries': pending_retries,
+            'triggers': triggers
+        }
+
+
+class IngressHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: Optional[Dict[str, Any]] = None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(payload)))
+        if payload:
+            self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            return self._reply(200, self.server.emulator.snapshot())
+        self._reply(404)
+
+    def do_POST(self):
+        received_at = time.monotonic()
+        emulator = self.server.emulator
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        broker = emulator.routes.get(self.path.rstrip('/'))
+        if broker is None:
+            return self._reply(404, {'error': f'No broker at {self.path}'})
+        try:
+            events = parse_events(self.headers, body)
+        except ValueError as e:
+            with emulator._stats_lock:
+                emulator.ingress['rejected'] += 1
+            return self._reply(400, {'error': str(e)})
+        emulator.ingest(broker, events, received_at)
+        self._reply(202)
+
+
+class IngressServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, emulator: BrokerEmulator, host: str, port: int):
+        super().__init__((host, port), IngressHandler)
+        self.emulator = emulator
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 Knative Broker 模拟器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--config', action='append',
+                        help='包含 Broker / Trigger 定义的 YAML，可重复指定；默认使用 infrastructure/knative')
+    parser.add_argument('--namespace', help='只加载该 namespace 下的资源')
+    parser.add_argument('--subscriber', action='append', default=[],
+                        help='Service 订阅者地址映射，格式 name=http://host:port，可重复指定')
+    parser.add_argument('--workers', type=int, default=32, help='投递线程数')
+    parser.add_argument('--default-retry', type=int, default=0, help='Trigger 未配置 delivery 时的重试次数')
+    parser.add_argument('--default-backoff-policy', choices=['exponential', 'linear'], default='exponential')
+    parser.add_argument('--default-backoff-delay', default='PT0.2S')
+    parser.add_argument('--default-dead-letter-sink', help='Trigger 未配置死信目标时使用的 URL')
+    parser.add_argument('--report', help='退出时把统计信息写入该文件')
+    args = parser.parse_args()
+
+    configs = args.config or [
+        os.path.join(REPO_ROOT, 'infrastructure', 'knative', 'broker.yaml'),
+        os.path.join(REPO_ROOT, 'infrastructure', 'knative', 'trigger.yaml')
+    ]
+    subscribers = dict(item.split('=', 1) for item in args.subscriber)
+    default_delivery = DeliverySpec(
+        retry=args.default_retry,
+        backoff_policy=args.default_backoff_policy,
+        backoff_delay=parse_duration(args.default_backoff_delay, 0.2),
+        dead_letter_sink=args.default_dead_letter_sink
+    )
+    triggers, brokers = load_triggers(configs, subscribers, default_delivery, args.namespace)
+
+    emulator = BrokerEmulator(triggers, brokers, workers=args.workers)
+    emulator.start()
+    server = IngressServer(emulator, args.host, args.port)
+
+    print(f"Broker emulator listening on http://{args.host}:{server.server_port}", file=sys.stderr)
+    for route in emulator.routes:
+        print(f"  ingress: http://{args.host}:{server.server_port}{route}", file=sys.stderr)
+    for trigger in triggers:
+        print(f"  trigger {trigger.name}: {trigger.filters or '*'} -> {trigger.subscriber}", file=sys.stderr)
+
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        write_report(emulator.snapshot(), args.report)
+
+
+if __name__ == '__main__':
+    main()
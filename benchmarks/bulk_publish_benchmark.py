@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Dapr 发布路径吞吐量对比
+在本地启动一个模拟 Dapr sidecar 的 HTTP 服务器，对比以下发布方式发送 N 条消息的吞吐量：
+
+  per_call_client     每次调用新建客户端、逐条发布（原 /test-publish 的做法，不含 100ms 间隔）
+  pooled_sequential   长连接客户端逐条发布
+  pooled_concurrent   长连接客户端并发单条发布（sidecar 不支持 bulk 时的回退路径）
+  bulk                通过 bulk publish 接口批量发布
+
+示例:
+  python benchmarks/bulk_publish_benchmark.py --messages 2000 --sidecar-latency-ms 2
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any
+
+from common import load_module, quiet_logging, write_report
+
+CONSUMER_PATH = 'dapr-retry-consumer-example.py'
+
+
+class FakeSidecarHandler(BaseHTTPRequestHandler):
+    """模拟 sidecar 的发布接口：单条发布与 bulk publish"""
+
+    protocol_version = 'HTTP/1.1'
+    # 关闭 Nagle 算法，避免响应头与响应体分两次写出时触发延迟确认
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: Dict[str, Any] = None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(payload)))
+        if payload:
+            self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        config = self.server.config
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+
+        if self.path.startswith('/v1.0-alpha1/publish/bulk/'):
+            if not config['bulk_supported']:
+                return self._reply(404)
+            time.sleep(config['latency'] + config['per_entry_latency'] * len(body))
+            failed = [
+                {'entryId': entry['entryId'], 'error': 'simulated broker error'}
+                for entry in body if random.random() < config['failure_rate']
+            ]
+            self.server.count(len(body) - len(failed))
+            if failed:
+                return self._reply(500, {'failedEntries': failed, 'errorCode': 'ERR_PUBSUB_PUBLISH_MESSAGE'})
+            return self._reply(204)
+
+        if self.path.startswith('/v1.0/publish/'):
+            time.sleep(config['latency'])
+            if random.random() < config['failure_rate']:
+                return self._reply(500, {'errorCode': 'ERR_PUBSUB_PUBLISH_MESSAGE'})
+            self.server.count(1)
+            return self._reply(204)
+
+        self._reply(404)
+
+
+class FakeSidecar(ThreadingHTTPServer):
+    """后台线程运行的模拟 sidecar"""
+
+    daemon_threads = True
+
+    def __init__(self, latency: float, per_entry_latency: float, failure_rate: float, bulk_supported: bool):
+        super().__init__(('127.0.0.1', 0), FakeSidecarHandler)
+        self.config = {
+            'latency': latency,
+            'per_entry_latency': per_entry_latency,
+            'failure_rate': failure_rate,
+            'bulk_supported': bulk_supported
+        }
+        self.published = 0
+        self._lock = threading.Lock()
+        self.url = f"http://127.0.0.1:{self.server_port}"
+
+    def count(self, n: int):
+        with self._lock:
+            self.published += n
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def make_messages(n: int):
+    return [
+        {'id': f'bench-{i}', 'message': f'Bench message {i}', 'timestamp': datetime.utcnow().isoformat()}
+        for i in range(n)
+    ]
+
+
+def run_mode(module, mode: str, url: str, messages, pool_size: int, batch_size: int) -> Dict[str, Any]:
+    """按指定方式发布全部消息，返回耗时、吞吐量和失败条数"""
+    start = time.monotonic()
+    failed = 0
+
+    if mode == 'per_call_client':
+        for message in messages:
+            client = module.DaprPublisher(url, pool_size=1)
+            try:
+                client.publish('pubsub-with-retry', 'test-events', message)
+            except Exception:
+                failed += 1
+            client.session.close()
+            client.executor.shutdown(wait=False)
+    elif mode == 'pooled_sequential':
+        client = module.DaprPublisher(url, pool_size=pool_size)
+        for message in messages:
+            try:
+                client.publish('pubsub-with-retry', 'test-events', message)
+            except Exception:
+                failed += 1
+    else:
+        client = module.DaprPublisher(url, pool_size=pool_size, max_bulk_entries=batch_size)
+        if mode == 'pooled_concurrent':
+            client.bulk_supported = False
+        result = client.publish_bulk('pubsub-with-retry', 'test-events', messages)
+        failed = result['failed']
+
+    elapsed = time.monotonic() - start
+    return {
+        'messages': len(messages),
+        'failed': failed,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(len(messages) / elapsed, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dapr 发布路径吞吐量对比')
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=100, help='每次 bulk publish 的最大条数')
+    parser.add_argument('--pool-size', type=int, default=20)
+    parser.add_argument('--sidecar-latency-ms', type=float, default=2.0, help='sidecar 每次请求的处理延迟')
+    parser.add_argument('--per-entry-latency-ms', type=float, default=0.02, help='bulk 请求中每条消息的额外延迟')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='模拟的单条消息失败率')
+    parser.add_argument('--output', help='报告输出文件，默认打印到标准输出')
+    args = parser.parse_args()
+
+    module = load_module(CONSUMER_PATH, 'retry_consumer')
+    quiet_logging()
+    messages = make_messages(args.messages)
+
+    results = {}
+    with FakeSidecar(args.sidecar_latency_ms / 1000, args.per_entry_latency_ms / 1000,
+                     args.failure_rate, bulk_supported=True) as sidecar:
+        for mode in ['per_call_client', 'pooled_sequential', 'pooled_concurrent', 'bulk']:
+            results[mode] = run_mode(module, mode, sidecar.url, messages, args.pool_size, args.batch_size)
+
+    baseline = results['per_call_client']['throughput_per_second']
+    for result in results.values():
+        result['speedup'] = round(result['throughput_per_second'] / baseline, 2) if baseline else None
+
+    write_report({
+        'benchmark': 'dapr-bulk-publish',
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': vars(args),
+        'results': results
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+基准测试公共工具
+加载仓库中的演示应用、统计延迟分位数、输出 JSON 报告
+"""
+
+import os
+import sys
+import json
+import math
+import logging
+import threading
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+# 仓库根目录（benchmarks/ 的上一级）
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_module(relative_path: str, module_name: str, env: Optional[Dict[str, str]] = None):
+    """
+    按文件路径加载演示应用模块
+    根目录下的示例文件名带连字符，无法直接 import；env 会在模块加载前写入环境变量，
+    以便模块级的 os.getenv 配置生效
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    for key, value in (env or {}).items():
+        os.environ[key] = str(value)
+
+    path = os.path.join(REPO_ROOT, relative_path)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def quiet_logging(level: int = logging.WARNING):
+    """压测期间降低日志级别，避免逐条日志拖慢被测路径"""
+    logging.getLogger().setLevel(level)
+    for name in ['werkzeug'] + list(logging.root.manager.loggerDict):
+        logging.getLogger(name).setLevel(level)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩法计算分位数（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize_latencies(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, Any]:
+    """把一组延迟样本（秒）汇总为吞吐量和毫秒级分位数"""
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        'count': count,
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        'mean_ms': round(sum(values) / count * 1000, 3) if count else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p90_ms': round(percentile(values, 90) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if count else 0.0
+    }
+
+
+def write_report(report: Dict[str, Any], output: Optional[str] = None):
+    """输出 JSON 报告；未指定文件时打印到标准输出"""
+    text = json.dumps(report, indent=2, ensure_ascii=False, sort_keys=True)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+class LocalServer:
+    """在后台线程中用 werkzeug 多线程服务器运行 WSGI 应用，模拟真实的 HTTP 入口"""
+
+    def __init__(self, app, host: str = '127.0.0.1', port: int = 0):
+        from werkzeug.serving import make_server
+
+        self.server = make_server(host, port, app, threaded=True)
+        self.url = f"http://{host}:{self.server.server_port}"
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self._thread.join(timeout=5)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.count()
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class StubBroker(ThreadingHTTPServer):
+    """只返回固定状态码的最小 HTTP 接收端，用于隔离发送方自身的开销"""
+
+    daemon_threads = True
+
+    def __init__(self, status: int = 202):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.status = status
+        self.received = 0
+        self._lock = threading.Lock()
+        self.url = f"http://127.0.0.1:{self.server_port}"
+
+    def count(self):
+        with self._lock:
+            self.received += 1
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+多 Component 消费者隔离性压测
+对 dapr-multi-component-consumer.py 的 pod / deployment / service 路由施加合成负载：
+先测量各事件类型在轻负载下的基线，再依次压满其中一种事件类型，
+同时测量其余事件类型的 p50/p99 延迟与吞吐量，输出量化干扰程度的 JSON 报告。
+
+--isolation-mode scheduler 时消费者共用一个 Component：所有负载流经同一组并发名额（--shared-concurrency）投递，
+与 sidecar 对共享 Component 的投递方式一致，被拒绝（429）的请求按 --retry-backoff-ms 退避后重投。
+
+运行模式:
+  inprocess  通过 Flask test client 在进程内直接调用路由
+  server     在本地启动多线程 WSGI 服务器，压测程序充当 Dapr sidecar 通过 HTTP 投递
+  remote     投递到已运行的消费者（--target http://localhost:6001）
+
+示例:
+  python benchmarks/isolation_benchmark.py --mode server --duration 5 --output report.json
+"""
+
+import time
+import uuid
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import requests
+
+from common import LocalServer, load_module, quiet_logging, summarize_latencies, write_report
+
+CONSUMER_PATH = 'dapr-multi-component-consumer.py'
+
+# 与 dapr-multi-component-solution.yaml 中各 Component 的 concurrency 保持一致
+COMPONENT_CONCURRENCY = {
+    'pod_events': 50,
+    'deployment_events': 20,
+    'service_events': 10
+}
+
+# 与 dapr-multi-component-solution.yaml 中 shared-events-pubsub 的 concurrency 保持一致
+SHARED_COMPONENT_CONCURRENCY = 64
+
+
+class InProcessTransport:
+    """进程内传输：每个线程持有独立的 Flask test client"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self.app.test_client()
+            self._local.client = client
+        return client
+
+    def get_json(self, path: str):
+        return self._client().get(path).get_json()
+
+    def post_json(self, path: str, payload: Dict[str, Any]) -> int:
+        return self._client().post(path, json=payload).status_code
+
+
+class HttpTransport:
+    """HTTP 传输：每个线程持有独立的 keep-alive Session，行为接近 Dapr sidecar"""
+
+    def __init__(self, base_url: str, timeout: float = 30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def get_json(self, path: str):
+        response = self._session().get(self.base_url + path, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def post_json(self, path: str, payload: Dict[str, Any]) -> int:
+        response = self._session().post(self.base_url + path, json=payload, timeout=self.timeout)
+        return response.status_code
+
+
+class SharedSlotTransport:
+    """
+    共享 Component 的投递名额：所有事件类型的请求竞争同一组并发名额，
+    名额被占满时新请求在客户端排队，等待时间计入延迟
+    """
+
+    def __init__(self, transport, slots: int):
+        self.transport = transport
+        self._slots = threading.BoundedSemaphore(slots)
+
+    def get_json(self, path: str):
+        return self.transport.get_json(path)
+
+    def post_json(self, path: str, payload: Dict[str, Any]) -> int:
+        with self._slots:
+            return self.transport.post_json(path, payload)
+
+
+def discover_subscriptions(transport) -> Dict[str, Dict[str, Any]]:
+    """读取 /dapr/subscribe，按事件类型（pod_events 等）索引订阅配置"""
+    subscriptions = {}
+    for sub in transport.get_json('/dapr/subscribe'):
+        event_type = sub['topic'].replace('-', '_')
+        subscriptions[event_type] = sub
+    return subscriptions
+
+
+def build_envelope(subscription: Dict[str, Any], seq: int) -> Dict[str, Any]:
+    """构造与 Dapr sidecar 投递格式一致的 CloudEvent 信封"""
+    topic = subscription['topic']
+    return {
+        'specversion': '1.0',
+        'id': str(uuid.uuid4()),
+        'source': 'isolation-benchmark',
+        'type': 'com.dapr.event.sent',
+        'topic': topic,
+        'pubsubname': subscription['pubsubname'],
+        'datacontenttype': 'application/json',
+        'time': datetime.utcnow().isoformat() + 'Z',
+        'data': {'name': f'{topic}-bench-{seq}'}
+    }
+
+
+class LoadStream:
+    """
+    单一事件类型的负载流
+    rate > 0 时为开环负载：按固定节拍投递，延迟从计划发送时刻算起，包含排队时间；
+    rate 为空时为闭环饱和负载：concurrency 个工作线程背靠背投递
+    """
+
+    def __init__(self, transport, event_type: str, subscription: Dict[str, Any],
+                 concurrency: int, rate: Optional[float] = None, retry_backoff: float = 1.0):
+        self.transport = transport
+        self.event_type = event_type
+        self.subscription = subscription
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retry_backoff = retry_backoff
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.rejected = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _send(self, scheduled_at: float):
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        try:
+            status = self.transport.post_json(self.subscription['route'], build_envelope(self.subscription, seq))
+        except Exception:
+            status = None
+        latency = time.monotonic() - scheduled_at
+        with self._lock:
+            if status is not None and 200 <= status < 300:
+                self.latencies.append(latency)
+            elif status == 429:
+                self.rejected += 1
+            else:
+                self.errors += 1
+        if status == 429:
+            # 模拟 sidecar 重投前的退避，避免闭环负载空转
+            time.sleep(self.retry_backoff)
+
+    def _run_open_loop(self, deadline: float):
+        interval = 1.0 / self.rate
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            next_send = time.monotonic()
+            while next_send < deadline:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._send, next_send)
+                next_send += interval
+
+    def _run_closed_loop(self, deadline: float):
+        def worker():
+            while time.monotonic() < deadline:
+                self._send(time.monotonic())
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def run(self, duration: float) -> Dict[str, Any]:
+        start = time.monotonic()
+        deadline = start + duration
+        if self.rate:
+            self._run_open_loop(deadline)
+        else:
+            self._run_closed_loop(deadline)
+        summary = summarize_latencies(self.latencies, time.monotonic() - start, self.errors)
+        summary['rejected'] = self.rejected
+        summary['load'] = 'saturate' if not self.rate else f'{self.rate}/s'
+        summary['concurrency'] = self.concurrency
+        return summary
+
+
+def run_scenario(transport, subscriptions: Dict[str, Dict[str, Any]], duration: float,
+                 probe_rate: float, concurrency: Dict[str, int],
+                 saturate: Optional[str] = None, retry_backoff: float = 1.0) -> Dict[str, Any]:
+    """并发运行所有事件类型的负载流；saturate 指定的事件类型以闭环方式压满"""
+    streams = {
+        event_type: LoadStream(
+            transport, event_type, sub, concurrency[event_type],
+            rate=None if event_type == saturate else probe_rate, retry_backoff=retry_backoff
+        )
+        for event_type, sub in subscriptions.items()
+    }
+    results = {}
+
+    def run_stream(event_type, stream):
+        results[event_type] = stream.run(duration)
+
+    threads = [threading.Thread(target=run_stream, args=item) for item in streams.items()]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def _ratio(value: float, base: float) -> Optional[float]:
+    return round(value / base, 3) if base > 0 else None
+
+
+def compute_interference(baseline: Dict[str, Any], saturated: Dict[str, Dict[str, Any]],
+                         max_p99_ratio: float) -> Dict[str, Any]:
+    """对比基线，计算每个被压满的事件类型对其他事件类型的延迟/吞吐影响"""
+    interference = {}
+    worst = 0.0
+    for target, results in saturated.items():
+        victims = {}
+        for victim, stats in results.items():
+            if victim == target:
+                continue
+            base = baseline[victim]
+            p99_ratio = _ratio(stats['p99_ms'], base['p99_ms'])
+            victims[victim] = {
+                'p50_ratio': _ratio(stats['p50_ms'], base['p50_ms']),
+                'p99_ratio': p99_ratio,
+                'throughput_ratio': _ratio(stats['throughput_per_second'], base['throughput_per_second']),
+                'isolated': (p99_ratio is not None and p99_ratio <= max_p99_ratio
+                             and stats['errors'] == 0 and stats.get('rejected', 0) == 0)
+            }
+            if p99_ratio is not None:
+                worst = max(worst, p99_ratio)
+        interference[target] = {
+            'saturated_throughput_per_second': results[target]['throughput_per_second'],
+            'victims': victims
+        }
+    return {
+        'by_saturated_type': interference,
+        'worst_p99_ratio': round(worst, 3),
+        'max_p99_ratio': max_p99_ratio,
+        'isolated': all(
+            v['isolated'] for item in interference.values() for v in item['victims'].values()
+        )
+    }
+
+
+def make_transport(args):
+    """
+    根据运行模式构造传输层；server 模式额外返回需要关闭的本地服务器
+    scheduler 模式下所有负载流共享同一组投递名额
+    """
+    transport, server = _make_base_transport(args)
+    if args.isolation_mode == 'scheduler':
+        transport = SharedSlotTransport(transport, args.shared_concurrency)
+    return transport, server
+
+
+def stream_concurrency(args) -> Dict[str, int]:
+    """
+    各负载流的客户端并发数：components 模式下对应各自 Component 的 concurrency；
+    scheduler 模式下由共享名额限制总并发，每个流都可以占满全部名额
+    """
+    if args.isolation_mode == 'scheduler':
+        return {event_type: args.shared_concurrency for event_type in COMPONENT_CONCURRENCY}
+    return dict(COMPONENT_CONCURRENCY)
+
+
+def _make_base_transport(args):
+    if args.mode == 'remote':
+        return HttpTransport(args.target), None
+
+    consumer = load_module(CONSUMER_PATH, 'multi_component_consumer',
+                           env={'WORK_TIME_SCALE': args.work_scale,
+                                'ISOLATION_MODE': args.isolation_mode,
+                                'SHARED_COMPONENT_CONCURRENCY': args.shared_concurrency})
+    quiet_logging()
+    if args.mode == 'inprocess':
+        return InProcessTransport(consumer.app), None
+
+    server = LocalServer(consumer.app).__enter__()
+    return HttpTransport(server.url), server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多 Component 消费者隔离性压测')
+    parser.add_argument('--mode', choices=['inprocess', 'server', 'remote'], default='server')
+    parser.add_argument('--target', default='http://localhost:6001', help='remote 模式下的消费者地址')
+    parser.add_argument('--work-scale', type=float, default=0.02,
+                        help='进程内/本地服务器模式下的 WORK_TIME_SCALE')
+    parser.add_argument('--isolation-mode', choices=['components', 'scheduler'], default='components',
+                        help='消费者的隔离模式：进程内/本地服务器模式下设置消费者的 ISOLATION_MODE；'
+                             'scheduler 模式下所有负载流共享 --shared-concurrency 个投递名额')
+    parser.add_argument('--shared-concurrency', type=int, default=SHARED_COMPONENT_CONCURRENCY,
+                        help='scheduler 模式下共享 Component 的 concurrency（所有负载流共用的投递名额）')
+    parser.add_argument('--retry-backoff-ms', type=float, default=1000.0,
+                        help='请求被拒绝（429）后重投前的退避时间，对应 sidecar 的重投间隔')
+    parser.add_argument('--duration', type=float, default=5.0, help='每个场景的持续时间(秒)')
+    parser.add_argument('--probe-rate', type=float, default=10.0, help='非饱和事件类型的投递速率(条/秒)')
+    parser.add_argument('--saturate', action='append', choices=list(COMPONENT_CONCURRENCY),
+                        help='需要压满的事件类型，可重复指定；默认依次压满全部类型')
+    parser.add_argument('--saturate-concurrency', type=int, default=None,
+                        help='饱和负载的并发数，默认使用对应 Component 的 concurrency'
+                             '（scheduler 模式下为共享名额数）')
+    parser.add_argument('--max-p99-ratio', type=float, default=1.5,
+                        help='判定为"隔离"的最大 p99 延迟放大倍数')
+    parser.add_argument('--output', help='报告输出文件，默认打印到标准输出')
+    args = parser.parse_args()
+
+    transport, server = make_transport(args)
+    retry_backoff = args.retry_backoff_ms / 1000
+    try:
+        subscriptions = discover_subscriptions(transport)
+        baseline = run_scenario(transport, subscriptions, args.duration, args.probe_rate,
+                                stream_concurrency(args), retry_backoff=retry_backoff)
+
+        saturated = {}
+        for target in args.saturate or list(subscriptions):
+            concurrency = stream_concurrency(args)
+            if args.saturate_concurrency:
+                concurrency[target] = args.saturate_concurrency
+            saturated[target] = run_scenario(transport, subscriptions, args.duration, args.probe_rate,
+                                             concurrency, saturate=target, retry_backoff=retry_backoff)
+    finally:
+        if server:
+            server.__exit__(None, None, None)
+
+    report = {
+        'benchmark': 'multi-component-isolation',
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': {
+            'mode': args.mode,
+            'target': args.target if args.mode == 'remote' else None,
+            'work_time_scale': args.work_scale if args.mode != 'remote' else None,
+            'isolation_mode': args.isolation_mode,
+            'duration_seconds': args.duration,
+            'probe_rate_per_second': args.probe_rate,
+            'concurrency': stream_concurrency(args),
+            'shared_concurrency': args.shared_concurrency if args.isolation_mode == 'scheduler' else None,
+            'retry_backoff_ms': args.retry_backoff_ms,
+            'saturate_concurrency': args.saturate_concurrency
+        },
+        'baseline': baseline,
+        'saturated': saturated,
+        'interference': compute_interference(baseline, saturated, args.max_p99_ratio)
+    }
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
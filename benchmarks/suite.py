@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+生产者 / 消费者热路径基准测试套件
+完全离线运行：生产者发送到本地 stub broker，消费者通过 Flask test client 或本地 WSGI 服务器调用。
+结果保存为 JSON，可作为基线与后续结果对比，超过阈值的退化会被标记并以非零状态码退出。
+
+示例:
+  python benchmarks/suite.py run --save-baseline
+  python benchmarks/suite.py run --output current.json
+  python benchmarks/suite.py compare --current current.json --threshold 0.10
+"""
+
+import os
+import sys
+import time
+import json
+import logging
+import argparse
+import platform
+import itertools
+import threading
+import contextlib
+from datetime import datetime
+from typing import Dict, Any, Callable, List
+
+import requests
+
+from common import (
+    REPO_ROOT, LocalServer, StubBroker, load_module, percentile, quiet_logging, write_report
+)
+
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, 'benchmarks', 'baselines', 'baseline.json')
+
+# 注册的基准用例: name -> {'setup': fn, 'iterations': int, 'concurrency': int}
+CASES: Dict[str, Dict[str, Any]] = {}
+
+
+def benchmark(name: str, iterations: int, concurrency: int = 1):
+    """注册基准用例；被装饰函数接收 ExitStack，返回单次操作的可调用对象"""
+    def decorator(setup: Callable):
+        CASES[name] = {'setup': setup, 'iterations': iterations, 'concurrency': concurrency}
+        return setup
+    return decorator
+
+
+def load_producer():
+    return load_module('producer/src/main.py', 'knative_producer')
+
+
+def load_consumer():
+    return load_module('consumer/src/main.py', 'knative_consumer',
+                       env={'PROCESSING_DELAY': '0', 'LOG_LEVEL': 'CRITICAL'})
+
+
+def load_retry_consumer():
+    return load_module('dapr-retry-consumer-example.py', 'retry_consumer',
+                       env={'FAILURE_RATE': '0', 'WORK_TIME_SCALE': '0'})
+
+
+def structured_event(event_type: str = 'demo.event'):
+    """构造一条 structured 模式的 CloudEvent 请求（headers, body）"""
+    from cloudevents.http import CloudEvent
+    from cloudevents.conversion import to_structured
+
+    event = CloudEvent({'type': event_type, 'source': 'benchmark'}, {'message': 'benchmark event'})
+    return to_structured(event)
+
+
+def dapr_envelope(message_id: str) -> Dict[str, Any]:
+    return {
+        'specversion': '1.0',
+        'id': message_id,
+        'source': 'benchmark',
+        'type': 'com.dapr.event.sent',
+        'topic': 'test-events',
+        'pubsubname': 'pubsub-with-retry',
+        'datacontenttype': 'application/json',
+        'data': {'id': message_id, 'message': 'benchmark message'}
+    }
+
+
+@benchmark('producer.create_event', iterations=20000)
+def producer_create_event(stack):
+    producer = load_producer().EventProducer('http://127.0.0.1:1', 'benchmark')
+    data = {'message': 'benchmark event', 'counter': 1}
+    return lambda: producer.create_event('demo.event', data)
+
+
+@benchmark('producer.send_event', iterations=500)
+def producer_send_event(stack):
+    broker = stack.enter_context(StubBroker(status=202))
+    producer = load_producer().EventProducer(broker.url, 'benchmark')
+    event = producer.create_event('demo.event', {'message': 'benchmark event'})
+    return lambda: producer.send_event(event)
+
+
+@benchmark('consumer.handle_event.test_client', iterations=2000)
+def consumer_test_client(stack):
+    client = load_consumer().app.test_client()
+    headers, body = structured_event()
+    return lambda: client.post('/', headers=headers, data=body)
+
+
+def _session_post(url: str, headers, body=None, json_body=None):
+    """每个线程复用一个 keep-alive Session"""
+    local = threading.local()
+
+    def op():
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        response = session.post(url, headers=headers, data=body, json=json_body)
+        response.raise_for_status()
+    return op
+
+
+@benchmark('consumer.handle_event.wsgi', iterations=1000)
+def consumer_wsgi(stack):
+    server = stack.enter_context(LocalServer(load_consumer().app))
+    headers, body = structured_event()
+    return _session_post(server.url + '/', headers, body)
+
+
+@benchmark('consumer.handle_event.wsgi_concurrent', iterations=2000, concurrency=8)
+def consumer_wsgi_concurrent(stack):
+    return consumer_wsgi(stack)
+
+
+@benchmark('dapr_retry.events', iterations=2000)
+def dapr_retry_events(stack):
+    client = load_retry_consumer().app.test_client()
+    ids = itertools.count()
+    return lambda: client.post('/events', json=dapr_envelope(f'bench-{next(ids)}'))
+
+
+@benchmark('dapr_retry.deadletter', iterations=2000)
+def dapr_retry_deadletter(stack):
+    client = load_retry_consumer().app.test_client()
+    envelope = dapr_envelope('bench-deadletter')
+    return lambda: client.post('/deadletter', json=envelope)
+
+
+def measure(op: Callable, iterations: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    """执行 warmup 后计时运行 iterations 次操作，按 concurrency 个线程均分"""
+    for _ in range(warmup):
+        op()
+
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def worker(n: int):
+        local = []
+        for _ in range(n):
+            started = time.perf_counter()
+            op()
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    per_thread = max(iterations // concurrency, 1)
+    threads = [threading.Thread(target=worker, args=(per_thread,)) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    # 直接从原始样本计算微秒级分位数；经 summarize_latencies 的毫秒取整会把个位数微秒的用例量化成整数，
+    # 单步跳变即超过退化阈值
+    values = sorted(latencies)
+    return {
+        'iterations': len(values),
+        'concurrency': concurrency,
+        'ops_per_second': round(len(values) / elapsed, 2),
+        'mean_us': round(sum(values) / len(values) * 1e6, 3),
+        'p50_us': round(percentile(values, 50) * 1e6, 3),
+        'p99_us': round(percentile(values, 99) * 1e6, 3)
+    }
+
+
+def run_suite(selected: List[str], scale: float, repeats: int) -> Dict[str, Any]:
+    """运行选中的用例；每个用例重复 repeats 次，取吞吐量中位数那一次的结果"""
+    results = {}
+    for name in selected:
+        case = CASES[name]
+        iterations = max(int(case['iterations'] * scale), case['concurrency'])
+        with contextlib.ExitStack() as stack:
+            op = case['setup'](stack)
+            quiet_logging(logging.CRITICAL)
+            runs = [
+                measure(op, iterations, case['concurrency'], warmup=max(iterations // 10, 1))
+                for _ in range(repeats)
+            ]
+        runs.sort(key=lambda r: r['ops_per_second'])
+        results[name] = runs[len(runs) // 2]
+        print(f"{name:45s} {results[name]['ops_per_second']:>12.1f} ops/s  "
+              f"p50 {results[name]['p50_us']:>10.1f}us  p99 {results[name]['p99_us']:>10.1f}us",
+              file=sys.stderr)
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    """
+    对比两份结果：吞吐量下降或 p50 延迟上升超过 threshold（比例）即视为退化
+    p99 仅作参考，不参与判定
+    """
+    cases = {}
+    regressions = []
+    for name, cur in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            cases[name] = {'status': 'new'}
+            continue
+        throughput_change = (cur['ops_per_second'] - base['ops_per_second']) / base['ops_per_second']
+        p50_change = (cur['p50_us'] - base['p50_us']) / base['p50_us'] if base['p50_us'] else 0.0
+        regressed = throughput_change < -threshold or p50_change > threshold
+        cases[name] = {
+            'status': 'regression' if regressed else 'ok',
+            'throughput_change': round(throughput_change, 4),
+            'p50_change': round(p50_change, 4),
+            'p99_change': round((cur['p99_us'] - base['p99_us']) / base['p99_us'], 4) if base['p99_us'] else None
+        }
+        if regressed:
+            regressions.append(name)
+
+    return {
+        'threshold': threshold,
+        'environment_matches': baseline.get('environment') == current.get('environment'),
+        'cases': cases,
+        'regressions': regressions
+    }
+
+
+def print_comparison(report: Dict[str, Any]):
+    if not report['environment_matches']:
+        print('⚠️  Baseline was recorded on a different environment; results may not be comparable',
+              file=sys.stderr)
+    for name, case in report['cases'].items():
+        if case['status'] == 'new':
+            print(f"{name:45s} NEW", file=sys.stderr)
+            continue
+        marker = '❌' if case['status'] == 'regression' else '✅'
+        print(f"{marker} {name:43s} throughput {case['throughput_change']:+8.1%}  "
+              f"p50 {case['p50_change']:+8.1%}", file=sys.stderr)
+
+
+def load_json(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生产者 / 消费者热路径基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='运行基准测试')
+    run_parser.add_argument('--filter', default='', help='只运行名称包含该子串的用例')
+    run_parser.add_argument('--scale', type=float, default=1.0, help='迭代次数缩放系数')
+    run_parser.add_argument('--repeats', type=int, default=3)
+    run_parser.add_argument('--output', help='结果输出文件，默认打印到标准输出')
+    run_parser.add_argument('--save-baseline', action='store_true', help='同时写入基线文件')
+    run_parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    run_parser.add_argument('--threshold', type=float, default=0.10,
+                            help='与已有基线对比时的退化阈值（比例）')
+
+    compare_parser = subparsers.add_parser('compare', help='对比结果与基线')
+    compare_parser.add_argument('--current', required=True)
+    compare_parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    compare_parser.add_argument('--threshold', type=float, default=0.10)
+    compare_parser.add_argument('--output', help='对比报告输出文件')
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        report = compare(load_json(args.baseline), load_json(args.current), args.threshold)
+        print_comparison(report)
+        if args.output:
+            write_report(report, args.output)
+        sys.exit(1 if report['regressions'] else 0)
+
+    selected = [name for name in CASES if args.filter in name]
+    results = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'environment': environment(),
+        'config': {'scale': args.scale, 'repeats': args.repeats},
+        'results': run_suite(selected, args.scale, args.repeats)
+    }
+    write_report(results, args.output)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        write_report(results, args.baseline)
+    elif os.path.exists(args.baseline):
+        report = compare(load_json(args.baseline), results, args.threshold)
+        print_comparison(report)
+        sys.exit(1 if report['regressions'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+本地 trace collector
+接收 producer / consumer 通过 TRACE_EXPORT_URL 批量导出的 span，按 span 名称统计延迟分布，
+并按 trace_id 索引最近的 trace，用于在单机上查看端到端链路（producer → broker → consumer）。
+
+接口:
+  POST /v1/spans         {"spans": [...]}
+  GET  /stats            各 span 名称的 count / p50 / p99
+  GET  /traces/<id>      单条 trace 的全部 span（按开始时间排序）
+
+示例:
+  python benchmarks/trace_collector.py --port 4318 --output spans.ndjson
+  TRACE_EXPORT_URL=http://localhost:4318/v1/spans TRACE_SAMPLE_RATE=1 python producer/src/main.py
+"""
+
+import sys
+import json
+import signal
+import argparse
+import threading
+from collections import OrderedDict, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+from common import percentile, write_report
+
+
+class SpanStore:
+    """
+    span 存储：每个 span 名称保留最近 max_samples 个耗时样本用于计算分位数，
+    trace 索引只保留最近 max_traces 条，超出时淘汰最早的 trace
+    """
+
+    def __init__(self, max_traces: int, max_samples: int, output: Optional[str] = None):
+        self.max_traces = max_traces
+        self.max_samples = max_samples
+        self.traces: 'OrderedDict[str, List[Dict[str, Any]]]' = OrderedDict()
+        self.durations: Dict[str, deque] = defaultdict(lambda: deque(maxlen=max_samples))
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.received = 0
+        self.batches = 0
+        self._output = open(output, 'a', encoding='utf-8') if output else None
+        self._lock = threading.Lock()
+
+    def add(self, spans: List[Dict[str, Any]]):
+        with self._lock:
+            self.batches += 1
+            for span in spans:
+                self.received += 1
+                name = span.get('name', 'unknown')
+                self.counts[name] += 1
+                self.durations[name].append(span.get('duration_ms', 0.0))
+
+                trace_id = span.get('trace_id')
+                if trace_id:
+                    self.traces.setdefault(trace_id, []).append(span)
+                    self.traces.move_to_end(trace_id)
+                    while len(self.traces) > self.max_traces:
+                        self.traces.popitem(last=False)
+            if self._output:
+                self._output.write(''.join(json.dumps(span) + '\n' for span in spans))
+                self._output.flush()
+
+    def trace(self, trace_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            spans = self.traces.get(trace_id)
+            return sorted(spans, key=lambda s: s.get('start_time', 0)) if spans else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = {}
+            for name, samples in sorted(self.durations.items()):
+                ordered = sorted(samples)
+                spans[name] = {
+                    'count': self.counts[name],
+                    'p50_ms': round(percentile(ordered, 50), 3),
+                    'p99_ms': round(percentile(ordered, 99), 3),
+                    'max_ms': round(ordered[-1], 3) if ordered else 0.0
+                }
+            return {
+                'received_spans': self.received,
+                'batches': self.batches,
+                'indexed_traces': len(self.traces),
+                'spans': spans
+            }
+
+    def close(self):
+        if self._output:
+            self._output.close()
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: Any = None):
+        payload = json.dumps(body, indent=2).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(payload)))
+        if payload:
+            self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if self.path != '/v1/spans':
+            return self._reply(404)
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            spans = body.get('spans') if isinstance(body, dict) else None
+            if not isinstance(spans, list):
+                return self._reply(400, {'error': 'Expected {"spans": [...]}'})
+        except ValueError as e:
+            return self._reply(400, {'error': str(e)})
+        self.server.store.add(spans)
+        self._reply(202, {'accepted': len(spans)})
+
+    def do_GET(self):
+        if self.path == '/stats':
+            return self._reply(200, self.server.store.stats())
+        if self.path.startswith('/traces/'):
+            spans = self.server.store.trace(self.path[len('/traces/'):])
+            if spans is None:
+                return self._reply(404, {'error': 'Trace not found'})
+            return self._reply(200, {'spans': spans})
+        self._reply(404)
+
+
+class CollectorServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, host: str, port: int, store: SpanStore):
+        super().__init__((host, port), CollectorHandler)
+        self.store = store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 trace collector')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=4318)
+    parser.add_argument('--output', help='以 NDJSON 追加写入收到的 span')
+    parser.add_argument('--max-traces', type=int, default=10000, help='按 trace_id 索引的最近 trace 数量')
+    parser.add_argument('--max-samples', type=int, default=100000, help='每个 span 名称保留的耗时样本数')
+    parser.add_argument('--report', help='退出时写入统计信息的文件，默认打印到标准输出')
+    args = parser.parse_args()
+
+    store = SpanStore(args.max_traces, args.max_samples, args.output)
+    server = CollectorServer(args.host, args.port, store)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+
+    print(f"Trace collector listening on http://{args.host}:{server.server_port}/v1/spans", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store.close()
+        write_report(store.stats(), args.report)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,15 +5,21 @@ Knative Event Consumer Service
 """
 
 import os
+import sys
 import json
 import time
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 
 from flask import Flask, request, jsonify
 from cloudevents.http import from_http
 
+# shared/ 在镜像中位于 /app（PYTHONPATH），本地直接运行时位于仓库根目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from shared.debug import install_debug_endpoints
+from shared.tracing import Tracer
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -31,6 +37,19 @@ PORT = int(os.getenv('PORT', 8080))
 # 设置日志级别
 logging.getLogger().setLevel(getattr(logging, LOG_LEVEL.upper()))
 
+# ==================== 分布式追踪 ====================
+# 通过 CloudEvents 分布式追踪扩展属性 traceparent（W3C Trace Context）串联 producer → broker → consumer。
+# 配置了 TRACE_EXPORT_FILE / TRACE_EXPORT_URL 时启用：延续上游 traceparent，只有被采样的 trace 才记录并导出 span（见 shared/tracing.py）
+
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE', '')
+TRACE_EXPORT_URL = os.getenv('TRACE_EXPORT_URL', '')
+TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '8192'))
+TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', '1.0'))
+
+tracer = Tracer('event-consumer', TRACE_SAMPLE_RATE, TRACE_EXPORT_FILE, TRACE_EXPORT_URL,
+                TRACE_BUFFER_SIZE, TRACE_EXPORT_INTERVAL)
+
 class EventProcessor:
     """事件处理器类"""
     
@@ -132,16 +151,61 @@ class EventProcessor:
 # 初始化事件处理器
 processor = EventProcessor()
 
+def record_event_spans(cloud_event, received_at: float, parse_time: float, handle_time: float,
+                       result: Dict[str, Any]):
+    """
+    延续上游 trace，记录排队、解析和处理三段耗时
+    上游没有 traceparent 时以本服务为起点，按本地采样率决定是否记录
+    """
+    if not tracer.enabled:
+        return
+    context = Tracer.parse_traceparent(cloud_event.get('traceparent') or request.headers.get('traceparent'))
+    if context:
+        trace_id, parent_span_id, sampled = context
+    else:
+        (trace_id, sampled), parent_span_id = tracer.start_trace(), None
+    if not sampled:
+        return
+    
+    span_id = tracer.new_span_id()
+    attributes = {'event.type': cloud_event['type'], 'event.id': cloud_event['id']}
+    tracer.record(trace_id, span_id, parent_span_id, 'consumer.handle_event', received_at,
+                  parse_time + handle_time, attributes)
+    
+    # 排队时间：事件创建时刻（time 属性）到 consumer 收到请求，包含 broker 内的停留
+    event_time = cloud_event.get('time')
+    if event_time:
+        try:
+            created = datetime.fromisoformat(event_time.replace('Z', '+00:00'))
+            if created.tzinfo is None:
+                created = created.replace(tzinfo=timezone.utc)
+            created_at = created.timestamp()
+            tracer.record(trace_id, tracer.new_span_id(), parent_span_id, 'consumer.queue', created_at,
+                          max(received_at - created_at, 0.0), attributes)
+        except ValueError:
+            pass
+    
+    tracer.record(trace_id, tracer.new_span_id(), span_id, 'consumer.parse', received_at, parse_time)
+    tracer.record(trace_id, tracer.new_span_id(), span_id, 'consumer.process', received_at + parse_time,
+                  handle_time, {'result.status': result.get('status')})
+
 @app.route('/', methods=['POST'])
 def handle_event():
     """Knative 事件处理端点"""
     try:
+        received_at = time.time()
+        started = time.perf_counter()
+        
         # 从 HTTP 请求中解析 CloudEvent
         cloud_event = from_http(request.headers, request.get_data())
+        parsed = time.perf_counter()
         
         # 处理事件
         result = processor.process_event(cloud_event)
         
+        if tracer.enabled:
+            record_event_spans(cloud_event, received_at, parsed - started, time.perf_counter() - parsed, result)
+        
         # 记录处理结果
         logger.info(f"Event processed: {cloud_event['id']} - Status: {result.get('status')}")
         
@@ -180,7 +244,8 @@ def metrics():
         'failed_events': processor.failed_events,
         'success_rate': (processor.processed_events / max(processor.processed_events + processor.failed_events, 1)) * 100,
         'uptime_seconds': uptime,
-        'events_per_minute': (processor.processed_events / max(uptime / 60, 1))
+        'events_per_minute': (processor.processed_events / max(uptime / 60, 1)),
+        'tracing': tracer.snapshot()
     })
 
 @app.route('/stats', methods=['GET'])
@@ -205,6 +270,17 @@ def stats():
         'timestamp': datetime.utcnow().isoformat()
     })
 
+# ==================== 调试与性能分析 ====================
+# 设置 DEBUG_TOKEN 后启用 /debug/* 端点，请求需携带 Authorization: Bearer <DEBUG_TOKEN>（见 shared/debug.py）
+
+# 需要计时的热路径
+HOT_PATH_TARGETS = [
+    ('process_event', processor, 'process_event'),
+    ('from_http', sys.modules[__name__], 'from_http')
+]
+
+debug_sync = install_debug_endpoints(app, 'event-consumer', HOT_PATH_TARGETS)
+
 if __name__ == '__main__':
     logger.info(f"Starting Event Consumer Service on port {PORT}")
     logger.info(f"Processing delay: {PROCESSING_DELAY} seconds")
@@ -4,11 +4,14 @@ Dapr 多 Component 消费者应用
 使用不同的 Component 实现真正的并发隔离
 """
 
+import os
 import json
 import copy
 import time
 import logging
 import threading
+from collections import deque
+from concurrent.futures import Future
 from datetime import datetime
 from flask import Flask, request, jsonify, Response
 
@@ -18,14 +21,44 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# 模拟处理耗时的缩放系数（本地压测时调小，可按比例缩短各事件的处理时间）
+WORK_TIME_SCALE = float(os.getenv('WORK_TIME_SCALE', '1.0'))
+
+# 隔离模式:
+#   components - 每种事件类型使用独立 Component，由 sidecar 的 concurrency 隔离（默认）
+#   scheduler  - 所有事件类型共用一个 Component，由进程内加权公平调度器隔离
+ISOLATION_MODE = os.getenv('ISOLATION_MODE', 'components')
+SHARED_PUBSUB_NAME = os.getenv('SHARED_PUBSUB_NAME', 'shared-events-pubsub')
+# 默认小于各类型 max_concurrency 之和（8 + 4 + 2 = 14），worker 不够分时才需要由权重决定谁先处理
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '8'))
+# 与 dapr-multi-component-solution.yaml 中 shared-events-pubsub 的 concurrency 保持一致
+SHARED_COMPONENT_CONCURRENCY = int(os.getenv('SHARED_COMPONENT_CONCURRENCY', '64'))
+
+# 各事件类型的调度策略: weight 决定每轮获得的处理时间份额，max_concurrency 限制同时处理数，
+# 已接纳（排队 + 处理中）的请求数默认按 weight 占比分配 SHARED_COMPONENT_CONCURRENCY，可用 max_admitted 覆盖
+# 注意: 只有 SCHEDULER_WORKERS 小于各类型 max_concurrency 之和时 worker 才会不够分，weight 才起作用；
+# 否则每种类型都能用满自己的 max_concurrency，隔离只由 max_concurrency 和已接纳上限保证
+# 可通过 SCHEDULER_POLICY 环境变量（JSON）覆盖，例如 {"service_events": {"weight": 2}}
+SCHEDULER_POLICY = {
+    'pod_events': {'weight': 5, 'max_concurrency': 8},
+    'deployment_events': {'weight': 2, 'max_concurrency': 4},
+    'service_events': {'weight': 1, 'max_concurrency': 2}
+}
+for _event_type, _overrides in json.loads(os.getenv('SCHEDULER_POLICY', '{}')).items():
+    SCHEDULER_POLICY.setdefault(_event_type, {}).update(_overrides)
+
 # 消息处理统计
 stats = {
-    'pod_events': {'processed': 0, 'failed': 0, 'active': 0},
-    'deployment_events': {'processed': 0, 'failed': 0, 'active': 0},
-    'service_events': {'processed': 0, 'failed': 0, 'active': 0}
+    'pod_events': {'processed': 0, 'failed': 0, 'rejected': 0, 'active': 0},
+    'deployment_events': {'processed': 0, 'failed': 0, 'rejected': 0, 'active': 0},
+    'service_events': {'processed': 0, 'failed': 0, 'rejected': 0, 'active': 0}
 }
 stats_lock = threading.Lock()
 
+def simulate_work(seconds):
+    """按 WORK_TIME_SCALE 缩放后模拟处理耗时"""
+    time.sleep(seconds * WORK_TIME_SCALE)
+
 def update_stats(event_type, action):
     """线程安全地更新统计信息"""
     with stats_lock:
@@ -37,17 +70,188 @@ def update_stats(event_type, action):
         elif action == 'fail':
             stats[event_type]['failed'] += 1
             stats[event_type]['active'] -= 1
+        elif action == 'reject':
+            stats[event_type]['rejected'] += 1
+            stats[event_type]['active'] -= 1
+
+class EventQueue:
+    """单一事件类型的待处理队列及其调度状态"""
+
+    def __init__(self, event_type, weight, max_concurrency, max_admitted, initial_cost=0.1):
+        self.event_type = event_type
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.max_admitted = max_admitted
+        self.items = deque()
+        self.deficit = 0.0
+        self.active = 0
+        self.admitted = 0
+        self.dispatched = 0
+        self.rejected = 0
+        # 单条消息处理耗时的滑动平均（秒），作为 DRR 中每条消息的"成本"
+        self.cost = initial_cost
+        self.total_wait = 0.0
+
+    def eligible(self):
+        return bool(self.items) and self.active < self.max_concurrency
+
+
+class DeficitRoundRobinScheduler:
+    """
+    进程内加权公平调度器（Deficit Round-Robin）
+    每种事件类型一个队列；每轮访问时队列获得 weight * quantum 的处理时间额度，
+    额度足以覆盖队首消息的预估耗时时才派发，从而按权重分配工作线程的处理时间，
+    慢消息（service 事件）无法挤占快消息（pod 事件）的份额
+
+    每个请求在排队和处理期间都占用共享 Component 的一个投递名额，
+    因此每种事件类型已接纳的请求数按 weight 占比限制在 component_concurrency 之内，
+    超出时直接拒绝让 sidecar 稍后重投，避免慢消息在队列中占满名额、其他类型在 sidecar 侧排队
+    """
+
+    def __init__(self, policy, workers, component_concurrency, quantum=0.1):
+        self.quantum = quantum
+        total_weight = sum(cfg.get('weight', 1) for cfg in policy.values())
+        self.queues = [
+            EventQueue(
+                event_type, cfg.get('weight', 1), cfg.get('max_concurrency', workers),
+                cfg.get('max_admitted',
+                        max(component_concurrency * cfg.get('weight', 1) // total_weight, 1))
+            )
+            for event_type, cfg in policy.items()
+        ]
+        self._by_type = {q.event_type: q for q in self.queues}
+        self._cursor = 0
+        self._granted = False
+        self._cond = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f'drr-worker-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, event_type, fn, *args):
+        """提交一条消息的处理函数，返回可等待结果的 Future；该类型已接纳数达到上限时返回 None"""
+        future = Future()
+        with self._cond:
+            queue = self._by_type[event_type]
+            if queue.admitted >= queue.max_admitted:
+                queue.rejected += 1
+                return None
+            queue.admitted += 1
+            queue.items.append((fn, args, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def _pick(self):
+        """按 DRR 选出下一条可派发的消息；没有可派发的消息时返回 None（需持有锁）"""
+        while any(q.eligible() for q in self.queues):
+            queue = self.queues[self._cursor]
+            if queue.eligible():
+                if not self._granted:
+                    queue.deficit += queue.weight * self.quantum
+                    self._granted = True
+                if queue.deficit >= queue.cost:
+                    queue.deficit -= queue.cost
+                    return queue, queue.items.popleft()
+            elif not queue.items:
+                # 空队列不累积额度，避免空闲后突发占满工作线程
+                queue.deficit = 0.0
+            self._cursor = (self._cursor + 1) % len(self.queues)
+            self._granted = False
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                picked = self._pick()
+                while picked is None:
+                    self._cond.wait()
+                    picked = self._pick()
+                queue, (fn, args, future, enqueued_at) = picked
+                queue.active += 1
+                queue.dispatched += 1
+                queue.total_wait += time.monotonic() - enqueued_at
+
+            started = time.monotonic()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            elapsed = time.monotonic() - started
+
+            with self._cond:
+                queue.active -= 1
+                queue.admitted -= 1
+                queue.cost = 0.8 * queue.cost + 0.2 * elapsed
+                self._cond.notify_all()
+
+    def snapshot(self):
+        """返回各队列的调度状态"""
+        with self._cond:
+            return {
+                q.event_type: {
+                    'weight': q.weight,
+                    'max_concurrency': q.max_concurrency,
+                    'max_admitted': q.max_admitted,
+                    'queued': len(q.items),
+                    'active': q.active,
+                    'dispatched': q.dispatched,
+                    'rejected': q.rejected,
+                    'deficit': round(q.deficit, 4),
+                    'avg_cost_ms': round(q.cost * 1000, 2),
+                    'avg_wait_ms': round(q.total_wait / max(q.dispatched, 1) * 1000, 2)
+                }
+                for q in self.queues
+            }
+
+
+# scheduler 模式下创建调度器；components 模式下直接在请求线程中处理
+scheduler = DeficitRoundRobinScheduler(
+    SCHEDULER_POLICY, SCHEDULER_WORKERS, SHARED_COMPONENT_CONCURRENCY
+) if ISOLATION_MODE == 'scheduler' else None
+
+def dispatch_event(event_type, handler):
+    """
+    解析请求并处理事件；scheduler 模式下交由调度器排队执行
+    该类型已接纳数达到上限时返回 429，Dapr 会按 Component 的重试策略稍后重投
+    """
+    update_stats(event_type, 'start')
+
+    try:
+        event_data = request.get_json()
+        if scheduler:
+            future = scheduler.submit(event_type, handler, event_data)
+            if future is None:
+                update_stats(event_type, 'reject')
+                return Response(status=429)
+            future.result()
+        else:
+            handler(event_data)
+
+        update_stats(event_type, 'success')
+        return Response(status=200)
+
+    except Exception as e:
+        update_stats(event_type, 'fail')
+        logger.error(f"❌ [{event_type}] Error: {str(e)}")
+        return Response(status=500)
+
+def pubsub_name_for(component_name):
+    """scheduler 模式下所有订阅共用同一个 Component"""
+    return SHARED_PUBSUB_NAME if ISOLATION_MODE == 'scheduler' else component_name
 
 @app.route('/dapr/subscribe', methods=['GET'])
 def subscribe():
     """
     Dapr 订阅配置 - 使用不同的 Component
-    每种消息类型使用专用的 Component，实现真正的隔离
+    每种消息类型使用专用的 Component，实现真正的隔离；
+    scheduler 模式下共用 SHARED_PUBSUB_NAME，由进程内调度器隔离
     """
     subscriptions = [
         # Pod 事件 - 使用高并发 Component
         {
-            "pubsubname": "pod-events-pubsub",      # 专用Component
+            "pubsubname": pubsub_name_for("pod-events-pubsub"),      # 专用Component
             "topic": "pod-events",
             "route": "/pod-events",
             "metadata": {
@@ -56,7 +260,7 @@ def subscribe():
         },
         # Deployment 事件 - 使用中等并发 Component
         {
-            "pubsubname": "deployment-events-pubsub",  # 专用Component
+            "pubsubname": pubsub_name_for("deployment-events-pubsub"),  # 专用Component
             "topic": "deployment-events", 
             "route": "/deployment-events",
             "metadata": {
@@ -65,7 +269,7 @@ def subscribe():
         },
         # Service 事件 - 使用低并发 Component  
         {
-            "pubsubname": "service-events-pubsub",     # 专用Component
+            "pubsubname": pubsub_name_for("service-events-pubsub"),     # 专用Component
             "topic": "service-events",
             "route": "/service-events",
             "metadata": {
@@ -74,35 +278,59 @@ def subscribe():
         }
     ]
     
-    logger.info(f"📋 Returning {len(subscriptions)} subscriptions with isolated components")
+    logger.info(f"📋 Returning {len(subscriptions)} subscriptions (isolation mode: {ISOLATION_MODE})")
     return jsonify(subscriptions)
 
+def process_pod_event(event_data):
+    """Pod 事件处理逻辑 - 轻量级处理"""
+    pod_name = event_data.get('data', {}).get('name', 'unknown')
+    
+    logger.info(f"🔵 [Pod-{threading.current_thread().ident}] Processing pod: {pod_name}")
+    
+    # 轻量级处理 - 快速响应
+    simulate_work(0.1)  # 模拟快速处理
+    
+    logger.info(f"✅ [Pod] Processed {pod_name} quickly")
+
+def process_deployment_event(event_data):
+    """Deployment 事件处理逻辑 - 中等处理"""
+    deployment_name = event_data.get('data', {}).get('name', 'unknown')
+    
+    logger.info(f"🟢 [Deployment-{threading.current_thread().ident}] Processing deployment: {deployment_name}")
+    
+    # 中等复杂度处理
+    simulate_work(1.0)  # 模拟中等处理时间
+    
+    # 模拟一些业务逻辑
+    if 'critical' in deployment_name:
+        simulate_work(0.5)  # 关键部署需要额外检查
+    
+    logger.info(f"✅ [Deployment] Processed {deployment_name} with medium complexity")
+
+def process_service_event(event_data):
+    """Service 事件处理逻辑 - 复杂处理"""
+    service_name = event_data.get('data', {}).get('name', 'unknown')
+    
+    logger.info(f"🟡 [Service-{threading.current_thread().ident}] Processing service: {service_name}")
+    
+    # 复杂处理逻辑
+    simulate_work(3.0)  # 模拟复杂处理时间
+    
+    # 模拟复杂的业务逻辑
+    steps = ['validate', 'analyze', 'update_dependencies', 'notify']
+    for step in steps:
+        logger.info(f"🔄 [Service] {service_name} - executing {step}")
+        simulate_work(0.5)
+    
+    logger.info(f"✅ [Service] Processed {service_name} with complex logic")
+
 @app.route('/pod-events', methods=['POST'])
 def handle_pod_events():
     """
     Pod 事件处理器 - 高频，轻量级处理
     使用 pod-events-pubsub Component (50 并发)
     """
-    update_stats('pod_events', 'start')
-    
-    try:
-        event_data = request.get_json()
-        pod_name = event_data.get('data', {}).get('name', 'unknown')
-        
-        logger.info(f"🔵 [Pod-{threading.current_thread().ident}] Processing pod: {pod_name}")
-        
-        # 轻量级处理 - 快速响应
-        time.sleep(0.1)  # 模拟快速处理
-        
-        update_stats('pod_events', 'success')
-        logger.info(f"✅ [Pod] Processed {pod_name} quickly")
-        
-        return Response(status=200)
-        
-    except Exception as e:
-        update_stats('pod_events', 'fail')
-        logger.error(f"❌ [Pod] Error: {str(e)}")
-        return Response(status=500)
+    return dispatch_event('pod_events', process_pod_event)
 
 @app.route('/deployment-events', methods=['POST'])
 def handle_deployment_events():
@@ -110,30 +338,7 @@ def handle_deployment_events():
     Deployment 事件处理器 - 中频，中等处理
     使用 deployment-events-pubsub Component (20 并发)
     """
-    update_stats('deployment_events', 'start')
-    
-    try:
-        event_data = request.get_json()
-        deployment_name = event_data.get('data', {}).get('name', 'unknown')
-        
-        logger.info(f"🟢 [Deployment-{threading.current_thread().ident}] Processing deployment: {deployment_name}")
-        
-        # 中等复杂度处理
-        time.sleep(1.0)  # 模拟中等处理时间
-        
-        # 模拟一些业务逻辑
-        if 'critical' in deployment_name:
-            time.sleep(0.5)  # 关键部署需要额外检查
-        
-        update_stats('deployment_events', 'success')
-        logger.info(f"✅ [Deployment] Processed {deployment_name} with medium complexity")
-        
-        return Response(status=200)
-        
-    except Exception as e:
-        update_stats('deployment_events', 'fail')
-        logger.error(f"❌ [Deployment] Error: {str(e)}")
-        return Response(status=500)
+    return dispatch_event('deployment_events', process_deployment_event)
 
 @app.route('/service-events', methods=['POST'])
 def handle_service_events():
@@ -141,32 +346,7 @@ def handle_service_events():
     Service 事件处理器 - 低频，复杂处理
     使用 service-events-pubsub Component (10 并发)
     """
-    update_stats('service_events', 'start')
-    
-    try:
-        event_data = request.get_json()
-        service_name = event_data.get('data', {}).get('name', 'unknown')
-        
-        logger.info(f"🟡 [Service-{threading.current_thread().ident}] Processing service: {service_name}")
-        
-        # 复杂处理逻辑
-        time.sleep(3.0)  # 模拟复杂处理时间
-        
-        # 模拟复杂的业务逻辑
-        steps = ['validate', 'analyze', 'update_dependencies', 'notify']
-        for step in steps:
-            logger.info(f"🔄 [Service] {service_name} - executing {step}")
-            time.sleep(0.5)
-        
-        update_stats('service_events', 'success')
-        logger.info(f"✅ [Service] Processed {service_name} with complex logic")
-        
-        return Response(status=200)
-        
-    except Exception as e:
-        update_stats('service_events', 'fail')
-        logger.error(f"❌ [Service] Error: {str(e)}")
-        return Response(status=500)
+    return dispatch_event('service_events', process_service_event)
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -203,11 +383,17 @@ def metrics():
             "total_active": total_active,
             "success_rate_percent": round(success_rate, 2)
         },
+        "isolation_mode": ISOLATION_MODE,
         "component_isolation": {
             "pod_events_component": "pod-events-pubsub (50 concurrency)",
             "deployment_events_component": "deployment-events-pubsub (20 concurrency)",
             "service_events_component": "service-events-pubsub (10 concurrency)"
+        } if not scheduler else {
+            "shared_component": SHARED_PUBSUB_NAME,
+            "shared_component_concurrency": SHARED_COMPONENT_CONCURRENCY,
+            "scheduler_workers": SCHEDULER_WORKERS
         },
+        "scheduler": scheduler.snapshot() if scheduler else None,
         "isolation_benefits": [
             "Pod事件高并发不影响Deployment事件处理",
             "Service事件复杂处理不阻塞Pod事件",
@@ -219,7 +405,10 @@ def metrics():
 
 @app.route('/stress-test', methods=['POST'])
 def stress_test():
-    """压力测试端点 - 验证隔离效果"""
+    """
+    压力测试端点 - 被动观测一段时间内的处理速率
+    不产生任何负载；主动压测和干扰量化请使用 benchmarks/isolation_benchmark.py
+    """
     test_config = request.get_json() or {}
     duration = test_config.get('duration', 10)  # 测试时长(秒)
     
@@ -261,9 +450,15 @@ def stress_test():
 
 if __name__ == '__main__':
     logger.info("🚀 Starting multi-component Dapr consumer")
-    logger.info("🔧 Using isolated components for each event type:")
-    logger.info("   • Pod events → pod-events-pubsub (50 concurrency)")
-    logger.info("   • Deployment events → deployment-events-pubsub (20 concurrency)")  
-    logger.info("   • Service events → service-events-pubsub (10 concurrency)")
+    if scheduler:
+        logger.info(f"🔧 Using shared component {SHARED_PUBSUB_NAME} with weighted fair scheduler:")
+        for event_type, state in scheduler.snapshot().items():
+            logger.info(f"   • {event_type} → weight {state['weight']}, max concurrency {state['max_concurrency']}, "
+                        f"max admitted {state['max_admitted']}")
+    else:
+        logger.info("🔧 Using isolated components for each event type:")
+        logger.info("   • Pod events → pod-events-pubsub (50 concurrency)")
+        logger.info("   • Deployment events → deployment-events-pubsub (20 concurrency)")  
+        logger.info("   • Service events → service-events-pubsub (10 concurrency)")
     
     app.run(host='0.0.0.0', port=6001, debug=False) 
\ No newline at end of file
@@ -4,13 +4,19 @@ Dapr Redis 重试机制示例应用
 演示消息处理失败时的自动重试行为
 """
 
+import os
 import json
 import time
 import random
 import logging
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+import requests
+from requests.adapters import HTTPAdapter
 from flask import Flask, request, jsonify, Response
-from dapr.clients import DaprClient
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,29 +25,64 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
 # 模拟失败率（用于测试重试机制）
-FAILURE_RATE = 0.3  # 30% 的消息会失败
+FAILURE_RATE = float(os.getenv('FAILURE_RATE', '0.3'))  # 默认 30% 的消息会失败
+# 模拟处理耗时的缩放系数（本地压测时调小或设为 0）
+WORK_TIME_SCALE = float(os.getenv('WORK_TIME_SCALE', '1.0'))
 processed_count = 0
 failed_count = 0
 retry_count = 0
+bulk_batch_count = 0
+# 批量订阅会并发处理消息，计数器更新需加锁
+counter_lock = threading.Lock()
+
+# Dapr sidecar HTTP 地址
+DAPR_HTTP_ENDPOINT = os.getenv('DAPR_HTTP_ENDPOINT', f"http://localhost:{os.getenv('DAPR_HTTP_PORT', '3500')}")
+PUBLISH_POOL_SIZE = int(os.getenv('PUBLISH_POOL_SIZE', '20'))
+
+# 批量订阅配置：sidecar 攒够 maxMessagesCount 条或等待 maxAwaitDurationMs 后一次性投递
+BULK_SUBSCRIBE_ENABLED = os.getenv('BULK_SUBSCRIBE_ENABLED', 'false').lower() == 'true'
+BULK_MAX_MESSAGES_COUNT = int(os.getenv('BULK_MAX_MESSAGES_COUNT', '100'))
+BULK_MAX_AWAIT_DURATION_MS = int(os.getenv('BULK_MAX_AWAIT_DURATION_MS', '1000'))
+BULK_PROCESSING_WORKERS = int(os.getenv('BULK_PROCESSING_WORKERS', '16'))
 
 class MessageProcessor:
     def __init__(self):
         self.processed_messages = set()  # 防重复处理
+        # 正在处理的消息 id：批量订阅时同一批次可能包含重投的同一条消息，需在锁内完成检查并占位
+        self.in_flight_messages = set()
+        self._lock = threading.Lock()
         
     def process_message(self, message_data):
         """
         业务消息处理逻辑
         返回: (success: bool, should_retry: bool)
         """
-        global processed_count, failed_count, retry_count
-        
         message_id = message_data.get('id', 'unknown')
         message_content = message_data.get('message', '')
         
-        # 检查是否已处理过（幂等性保证）
-        if message_id in self.processed_messages:
+        # 检查是否已处理过或正在处理（幂等性保证）
+        with self._lock:
+            processed = message_id in self.processed_messages
+            in_flight = message_id in self.in_flight_messages
+            if not processed and not in_flight:
+                self.in_flight_messages.add(message_id)
+        if processed:
             logger.warning(f"💡 Message {message_id} already processed, skipping")
             return True, False
+        if in_flight:
+            # 同一条消息正在处理，结果未知：请求稍后重投，届时按已处理跳过或重新处理
+            logger.warning(f"💡 Message {message_id} is being processed, requesting retry")
+            return False, True
+        
+        try:
+            return self._process(message_id, message_content)
+        finally:
+            with self._lock:
+                self.in_flight_messages.discard(message_id)
+    
+    def _process(self, message_id, message_content):
+        """执行业务处理；调用方已占用该消息 id"""
+        global processed_count, failed_count, retry_count
         
         logger.info(f"🔄 Processing message: {message_id} - {message_content}")
         
@@ -49,14 +90,16 @@ class MessageProcessor:
         try:
             # 模拟随机失败（用于测试重试）
             if random.random() < FAILURE_RATE:
-                failed_count += 1
+                with counter_lock:
+                    failed_count += 1
                 logger.error(f"❌ Processing failed for message {message_id}")
                 
                 # 根据失败类型决定是否重试
                 failure_type = random.choice(['transient', 'permanent'])
                 if failure_type == 'transient':
                     # 暂时性错误，应该重试
-                    retry_count += 1
+                    with counter_lock:
+                        retry_count += 1
                     logger.info(f"🔁 Transient error, requesting retry for {message_id}")
                     return False, True
                 else:
@@ -65,34 +108,157 @@ class MessageProcessor:
                     return False, False
             
             # 模拟处理时间
-            time.sleep(random.uniform(0.1, 0.5))
+            time.sleep(random.uniform(0.1, 0.5) * WORK_TIME_SCALE)
             
             # 处理成功
-            self.processed_messages.add(message_id)
-            processed_count += 1
+            with self._lock:
+                self.processed_messages.add(message_id)
+            with counter_lock:
+                processed_count += 1
             logger.info(f"✅ Successfully processed message {message_id}")
             return True, False
             
         except Exception as e:
-            failed_count += 1
+            with counter_lock:
+                failed_count += 1
             logger.error(f"💥 Unexpected error processing {message_id}: {str(e)}")
             return False, True  # 未知错误，尝试重试
 
 # 创建消息处理器实例
 processor = MessageProcessor()
 
+class DaprPublisher:
+    """
+    长连接、连接池化的 Dapr 发布客户端
+    优先通过 sidecar 的 bulk publish 接口一次发送多条消息；
+    sidecar 不支持 bulk publish 时退化为并发的单条发布
+    """
+
+    BULK_PATH = '/v1.0-alpha1/publish/bulk/{pubsub}/{topic}'
+    SINGLE_PATH = '/v1.0/publish/{pubsub}/{topic}'
+
+    def __init__(self, endpoint: str, pool_size: int = 20, max_bulk_entries: int = 100, timeout: float = 10):
+        self.endpoint = endpoint.rstrip('/')
+        self.max_bulk_entries = max_bulk_entries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='dapr-publish')
+        # None 表示尚未探测；sidecar 返回 404 后记为 False，之后直接走单条发布
+        self.bulk_supported = None
+
+    def publish(self, pubsub_name: str, topic_name: str, message: Dict[str, Any]):
+        """发布单条消息，失败时抛出异常"""
+        response = self.session.post(
+            self.endpoint + self.SINGLE_PATH.format(pubsub=pubsub_name, topic=topic_name),
+            json=message,
+            timeout=self.timeout
+        )
+        if response.status_code not in (200, 204):
+            raise RuntimeError(f"Publish failed: {response.status_code} - {response.text}")
+
+    def publish_bulk(self, pubsub_name: str, topic_name: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        批量发布消息
+        返回: {'total', 'succeeded', 'failed', 'failed_entries': [{'entryId', 'error'}], 'mode'}
+        entryId 为消息在 messages 中的下标
+        """
+        failed_entries = []
+        mode = 'bulk'
+        for offset in range(0, len(messages), self.max_bulk_entries):
+            chunk = messages[offset:offset + self.max_bulk_entries]
+            if self.bulk_supported is not False:
+                chunk_failures = self._publish_bulk_chunk(pubsub_name, topic_name, chunk, offset)
+                if chunk_failures is not None:
+                    failed_entries.extend(chunk_failures)
+                    continue
+            mode = 'fallback'
+            failed_entries.extend(self._publish_concurrently(pubsub_name, topic_name, chunk, offset))
+
+        return {
+            'total': len(messages),
+            'succeeded': len(messages) - len(failed_entries),
+            'failed': len(failed_entries),
+            'failed_entries': failed_entries,
+            'mode': mode
+        }
+
+    def _publish_bulk_chunk(self, pubsub_name, topic_name, chunk, offset):
+        """通过 bulk publish 接口发送一批消息；sidecar 不支持时返回 None"""
+        entries = [
+            {'entryId': str(offset + i), 'event': message, 'contentType': 'application/json'}
+            for i, message in enumerate(chunk)
+        ]
+        try:
+            response = self.session.post(
+                self.endpoint + self.BULK_PATH.format(pubsub=pubsub_name, topic=topic_name),
+                json=entries,
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            return [{'entryId': entry['entryId'], 'error': str(e)} for entry in entries]
+
+        if response.status_code in (404, 405, 501):
+            logger.warning(f"⚠️ Bulk publish not supported by sidecar ({response.status_code}), falling back")
+            self.bulk_supported = False
+            return None
+
+        self.bulk_supported = True
+        if response.status_code in (200, 204):
+            return []
+
+        # 部分失败时 sidecar 返回 failedEntries；否则视为整批失败
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if body.get('failedEntries'):
+            return [
+                {'entryId': item.get('entryId'), 'error': item.get('error', body.get('errorCode', 'unknown'))}
+                for item in body['failedEntries']
+            ]
+        error = f"{response.status_code} - {response.text}"
+        return [{'entryId': entry['entryId'], 'error': error} for entry in entries]
+
+    def _publish_concurrently(self, pubsub_name, topic_name, chunk, offset):
+        """并发单条发布，返回失败条目"""
+        def publish_one(index, message):
+            try:
+                self.publish(pubsub_name, topic_name, message)
+                return None
+            except Exception as e:
+                return {'entryId': str(index), 'error': str(e)}
+
+        results = self.executor.map(publish_one, range(offset, offset + len(chunk)), chunk)
+        return [r for r in results if r is not None]
+
+
+# 进程内共享的发布客户端，复用连接池
+publisher = DaprPublisher(DAPR_HTTP_ENDPOINT, pool_size=PUBLISH_POOL_SIZE)
+
 @app.route('/dapr/subscribe', methods=['GET'])
 def subscribe():
     """Dapr 订阅端点配置"""
+    events_subscription = {
+        "pubsubname": "pubsub-with-retry",
+        "topic": "test-events",
+        "route": "/events",
+        "metadata": {
+            "consumerGroup": "retry-test-group"
+        }
+    }
+    if BULK_SUBSCRIBE_ENABLED:
+        events_subscription["route"] = "/events/bulk"
+        events_subscription["bulkSubscribe"] = {
+            "enabled": True,
+            "maxMessagesCount": BULK_MAX_MESSAGES_COUNT,
+            "maxAwaitDurationMs": BULK_MAX_AWAIT_DURATION_MS
+        }
+
     subscriptions = [
-        {
-            "pubsubname": "pubsub-with-retry",
-            "topic": "test-events",
-            "route": "/events",
-            "metadata": {
-                "consumerGroup": "retry-test-group"
-            }
-        },
+        events_subscription,
         {
             "pubsubname": "deadletter-handler", 
             "topic": "deadletter-topic",
@@ -133,6 +299,62 @@ def handle_events():
         # 未知错误，让 Dapr 重试
         return Response(status=500)
 
+# 批量订阅的消息处理线程池
+bulk_executor = ThreadPoolExecutor(max_workers=BULK_PROCESSING_WORKERS, thread_name_prefix='bulk-process')
+
+def process_bulk_entry(entry):
+    """
+    处理批量请求中的单条消息
+    将 (success, should_retry) 映射为 Dapr 的条目状态：
+    成功 -> SUCCESS，失败需重试 -> RETRY，永久失败 -> DROP
+    """
+    entry_id = entry.get('entryId')
+    try:
+        event = entry.get('event') or {}
+        # CloudEvent 格式的条目，业务数据在 data 字段中；原始消息直接作为业务数据
+        if 'cloudevents' in entry.get('contentType', '') and isinstance(event, dict):
+            message_data = event.get('data', {})
+        else:
+            message_data = event
+
+        success, should_retry = processor.process_message(message_data)
+        if success:
+            status = 'SUCCESS'
+        elif should_retry:
+            status = 'RETRY'
+        else:
+            status = 'DROP'
+
+    except Exception as e:
+        logger.error(f"💥 Error processing bulk entry {entry_id}: {str(e)}")
+        status = 'RETRY'
+
+    return {"entryId": entry_id, "status": status}
+
+@app.route('/events/bulk', methods=['POST'])
+def handle_bulk_events():
+    """批量事件处理端点，并发处理一批消息并逐条返回处理状态"""
+    global bulk_batch_count
+    try:
+        bulk_request = request.get_json()
+        entries = bulk_request.get('entries', [])
+        logger.info(f"📦 Received bulk request with {len(entries)} entries")
+        
+        statuses = list(bulk_executor.map(process_bulk_entry, entries))
+        with counter_lock:
+            bulk_batch_count += 1
+        
+        retries = sum(1 for s in statuses if s['status'] == 'RETRY')
+        if retries:
+            logger.warning(f"🔁 {retries}/{len(entries)} bulk entries will be retried by Dapr")
+        
+        return jsonify({"statuses": statuses})
+        
+    except Exception as e:
+        logger.error(f"💥 Error in bulk event handler: {str(e)}")
+        # 无法解析整个批次，让 Dapr 重试全部消息
+        return Response(status=500)
+
 @app.route('/deadletter', methods=['POST'])
 def handle_deadletter():
     """死信队列处理端点"""
@@ -184,33 +406,39 @@ def metrics():
         "retry_attempts": retry_count,
         "success_rate_percent": round((processed_count / max(processed_count + failed_count, 1)) * 100, 2),
         "unique_processed": len(processor.processed_messages),
+        "bulk_subscribe_enabled": BULK_SUBSCRIBE_ENABLED,
+        "bulk_batches": bulk_batch_count,
         "timestamp": datetime.utcnow().isoformat()
     })
 
 @app.route('/test-publish', methods=['POST'])
 def test_publish():
-    """测试消息发布端点"""
+    """测试消息发布端点（批量发布）"""
     try:
-        with DaprClient() as client:
-            for i in range(5):
-                message = {
-                    "id": f"test-msg-{int(time.time())}-{i}",
-                    "message": f"Test message {i}",
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "source": "test-publisher"
-                }
-                
-                client.publish_event(
-                    pubsub_name="pubsub-with-retry",
-                    topic_name="test-events", 
-                    data=json.dumps(message),
-                    data_content_type='application/json'
-                )
-                
-                logger.info(f"📤 Published test message {i}")
-                time.sleep(0.1)
+        request_data = request.get_json(silent=True) or {}
+        count = int(request_data.get('count', 5))
+        batch_ts = int(time.time())
+        messages = [
+            {
+                "id": f"test-msg-{batch_ts}-{i}",
+                "message": f"Test message {i}",
+                "timestamp": datetime.utcnow().isoformat(),
+                "source": "test-publisher"
+            }
+            for i in range(count)
+        ]
+        
+        result = publisher.publish_bulk("pubsub-with-retry", "test-events", messages)
+        logger.info(f"📤 Published {result['succeeded']}/{result['total']} test messages ({result['mode']})")
         
-        return jsonify({"status": "Published 5 test messages"})
+        # 全部成功 200，部分失败 207，全部失败（如 sidecar 不可达）500
+        if result['failed'] == 0:
+            status = 200
+        elif result['succeeded'] > 0:
+            status = 207
+        else:
+            status = 500
+        return jsonify({"status": f"Published {result['succeeded']} test messages", **result}), status
         
     except Exception as e:
         logger.error(f"💥 Error publishing test messages: {str(e)}")
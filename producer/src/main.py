@@ -5,17 +5,27 @@ Knative Event Producer Service
 """
 
 import os
+import sys
 import json
 import time
 import uuid
+import heapq
+import random
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, Any
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import requests
 from cloudevents.http import CloudEvent, to_structured
 
+# shared/ 在镜像中位于 /app（PYTHONPATH），本地直接运行时位于仓库根目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from shared.debug import install_debug_endpoints
+from shared.tracing import Tracer
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -31,6 +41,39 @@ EVENT_TYPE = os.getenv('EVENT_TYPE', 'demo.event')
 SOURCE = os.getenv('SOURCE', 'knative-demo-producer')
 PORT = int(os.getenv('PORT', 8080))
 
+# 周期性发送配置
+# SEND_INTERVAL: 每隔多少秒发送一个事件（三种事件类型轮流分摊），0 表示不启用
+# EMITTER_CONFIG: 按事件类型配置速率和数据模板的 JSON，设置后优先于 SEND_INTERVAL，例如
+#   {"demo.event": {"rate": 2, "payload": {"message": "tick {seq}"}}, "order.placed": {"rate": 0.5}}
+SEND_INTERVAL = float(os.getenv('SEND_INTERVAL', '0'))
+EMITTER_CONFIG = os.getenv('EMITTER_CONFIG', '')
+# 多 worker 部署时的协调方式: leader = 通过文件锁只让一个 worker 发送; split = 每个 worker 发送 1/N 的速率
+EMITTER_MODE = os.getenv('EMITTER_MODE', 'leader')
+EMITTER_LOCK_FILE = os.getenv('EMITTER_LOCK_FILE', '/tmp/knative-producer-emitter.lock')
+# split 模式下的 worker 数，未设置时取 gunicorn 的 WEB_CONCURRENCY；两者都没有时 split 模式拒绝启动
+EMITTER_WORKERS = int(os.getenv('EMITTER_WORKERS', os.getenv('WEB_CONCURRENCY', '0')))
+EMITTER_MAX_INFLIGHT = int(os.getenv('EMITTER_MAX_INFLIGHT', '4'))
+
+# 各事件类型的默认数据模板，字符串中的 {seq} / {timestamp} / {uuid} 会在发送时替换，字面花括号写成 {{ }}
+DEFAULT_PAYLOAD_TEMPLATES = {
+    'demo.event': {'message': 'Periodic demo event #{seq}', 'timestamp': '{timestamp}'},
+    'user.created': {'user_id': 'user-{seq}', 'email': 'user-{seq}@example.com', 'timestamp': '{timestamp}'},
+    'order.placed': {'order_id': 'order-{uuid}', 'amount': 99.9, 'timestamp': '{timestamp}'}
+}
+
+# ==================== 分布式追踪 ====================
+# 通过 CloudEvents 分布式追踪扩展属性 traceparent（W3C Trace Context）串联 producer → broker → consumer。
+# 配置了 TRACE_EXPORT_FILE / TRACE_EXPORT_URL 时启用：每个事件都带 traceparent，只有被采样的 trace 才记录并导出 span（见 shared/tracing.py）
+
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE', '')
+TRACE_EXPORT_URL = os.getenv('TRACE_EXPORT_URL', '')
+TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '8192'))
+TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', '1.0'))
+
+tracer = Tracer('event-producer', TRACE_SAMPLE_RATE, TRACE_EXPORT_FILE, TRACE_EXPORT_URL,
+                TRACE_BUFFER_SIZE, TRACE_EXPORT_INTERVAL)
+
 class EventProducer:
     """事件生产者类"""
     
@@ -51,11 +94,20 @@ class EventProducer:
             "datacontenttype": "application/json"
         }
         
+        # 分布式追踪扩展属性：span id 对应 send_event 的发送 span，consumer 的 span 以它为父节点；
+        # 追踪关闭时不生成，省掉每个事件的随机 id 和字符串拼接
+        if tracer.enabled:
+            trace_id, sampled = tracer.start_trace()
+            attributes["traceparent"] = tracer.format_traceparent(trace_id, tracer.new_span_id(), sampled)
+        
         event = CloudEvent(attributes, data)
         return event
     
     def send_event(self, event: CloudEvent) -> bool:
         """发送事件到 Broker"""
+        traceparent = event.get('traceparent') or ''
+        started = time.time() if traceparent.endswith('-01') else None
+        status_code = None
         try:
             headers, body = to_structured(event)
             
@@ -65,6 +117,7 @@ class EventProducer:
                 data=body,
                 timeout=10
             )
+            status_code = response.status_code
             
             if response.status_code == 202:
                 logger.info(f"Event sent successfully: {event['id']}")
@@ -76,10 +129,215 @@ class EventProducer:
         except Exception as e:
             logger.error(f"Error sending event: {str(e)}")
             return False
+        
+        finally:
+            if started is not None:
+                _, trace_id, span_id, _ = traceparent.split('-')
+                tracer.record(trace_id, span_id, None, 'producer.send_event', started, time.time() - started, {
+                    'event.type': event['type'],
+                    'event.id': event['id'],
+                    'http.status_code': status_code
+                })
+
+def render_template(template: Any, context: Dict[str, Any]) -> Any:
+    """递归替换模板中字符串里的占位符"""
+    if isinstance(template, str):
+        return template.format_map(context)
+    if isinstance(template, dict):
+        return {key: render_template(value, context) for key, value in template.items()}
+    if isinstance(template, list):
+        return [render_template(value, context) for value in template]
+    return template
+
+class EmitStream:
+    """单一事件类型的周期发送计划"""
+    
+    def __init__(self, event_type: str, rate: float, payload: Dict[str, Any]):
+        self.event_type = event_type
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.payload = payload
+        self.start = 0.0
+        self.tick = 0
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.max_lag = 0.0
+    
+    def due(self) -> float:
+        # 由起点和序号直接计算，误差不会随时间累积
+        return self.start + self.tick * self.period
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'rate_per_second': round(self.rate, 4),
+            'sent': self.sent,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'max_lag_ms': round(self.max_lag * 1000, 2)
+        }
+
+class PeriodicEmitter:
+    """
+    周期性事件发送器
+    在后台线程中按单调时钟调度各事件类型的发送时刻，发送本身交给小线程池执行，
+    不占用请求 worker；落后超过一个周期的时刻直接跳过，在途发送达到上限时也跳过，避免堆积。
+    每个进程在导入时启动自己的发送器，gunicorn 不要使用 --preload
+    """
+    
+    LEADER_RETRY_SECONDS = 5
+    
+    def __init__(self, producer: EventProducer, streams: list, mode: str, lock_file: str, max_inflight: int):
+        self.producer = producer
+        self.streams = streams
+        self.mode = mode
+        self.lock_file = lock_file
+        self.max_inflight = max_inflight
+        self.role = 'idle'
+        self._lock_fd = None
+        self._inflight = 0
+        self._counter_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+    
+    def start(self):
+        if not self.streams:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix='emitter-send')
+        self._thread = threading.Thread(target=self._run, name='periodic-emitter', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _try_acquire_leadership(self) -> bool:
+        import fcntl
+        
+        fd = os.open(self.lock_file, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+    
+    def _run(self):
+        if self.mode == 'leader':
+            self.role = 'follower'
+            while not self._try_acquire_leadership():
+                if self._stop.wait(self.LEADER_RETRY_SECONDS):
+                    return
+            self.role = 'leader'
+        else:
+            self.role = 'split'
+        logger.info(f"Periodic emitter started as {self.role} (pid {os.getpid()})")
+        
+        now = time.monotonic()
+        heap = []
+        for index, stream in enumerate(self.streams):
+            # 随机相位，避免多个 worker / 多种事件类型在同一时刻集中发送
+            stream.start = now + random.random() * stream.period
+            stream.tick = 0
+            heapq.heappush(heap, (stream.due(), index))
+        
+        while not self._stop.is_set():
+            due, index = heap[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+                continue
+            
+            heapq.heappop(heap)
+            stream = self.streams[index]
+            lag = -delay
+            if lag >= stream.period:
+                missed = int(lag / stream.period)
+                stream.skipped += missed
+                stream.tick += missed
+                lag -= missed * stream.period
+            stream.max_lag = max(stream.max_lag, lag)
+            
+            with self._counter_lock:
+                can_send = self._inflight < self.max_inflight
+                if can_send:
+                    self._inflight += 1
+            if can_send:
+                self._executor.submit(self._emit, stream, stream.tick + 1)
+            else:
+                stream.skipped += 1
+            
+            stream.tick += 1
+            heapq.heappush(heap, (stream.due(), index))
+    
+    def _emit(self, stream: EmitStream, seq: int):
+        try:
+            context = {'seq': seq, 'timestamp': datetime.utcnow().isoformat(), 'uuid': str(uuid.uuid4())}
+            event = self.producer.create_event(stream.event_type, render_template(stream.payload, context))
+            success = self.producer.send_event(event)
+        except Exception as e:
+            success = False
+            logger.error(f"Error in periodic emitter: {str(e)}")
+        with self._counter_lock:
+            self._inflight -= 1
+            if success:
+                stream.sent += 1
+            else:
+                stream.failed += 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'enabled': bool(self.streams),
+            'mode': self.mode,
+            'role': self.role,
+            'pid': os.getpid(),
+            'inflight': self._inflight,
+            'streams': {stream.event_type: stream.snapshot() for stream in self.streams}
+        }
+
+def build_emit_streams() -> list:
+    """根据 EMITTER_CONFIG 或 SEND_INTERVAL 生成发送计划；split 模式下按 worker 数分摊速率"""
+    if EMITTER_CONFIG:
+        config = json.loads(EMITTER_CONFIG)
+    elif SEND_INTERVAL > 0:
+        # 与原 ConfigMap 版本一致：每个间隔发送一个事件，三种类型轮流
+        per_type_rate = 1.0 / (SEND_INTERVAL * len(DEFAULT_PAYLOAD_TEMPLATES))
+        config = {event_type: {'rate': per_type_rate} for event_type in DEFAULT_PAYLOAD_TEMPLATES}
+    else:
+        return []
+    
+    if EMITTER_MODE == 'split' and EMITTER_WORKERS < 1:
+        # 不知道 worker 数就无法分摊速率，按 1 计算会让实际速率变成配置的 N 倍
+        raise RuntimeError('EMITTER_MODE=split requires EMITTER_WORKERS or WEB_CONCURRENCY')
+    share = EMITTER_WORKERS if EMITTER_MODE == 'split' else 1
+    streams = [
+        EmitStream(
+            event_type,
+            float(options['rate']) / share,
+            options.get('payload', DEFAULT_PAYLOAD_TEMPLATES.get(event_type, {'message': '{seq}'}))
+        )
+        for event_type, options in config.items()
+        if float(options.get('rate', 0)) > 0
+    ]
+    
+    # 用示例上下文先渲染一次，未知占位符或未转义的花括号在启动时报错，而不是每次发送都失败
+    sample_context = {'seq': 0, 'timestamp': datetime.utcnow().isoformat(), 'uuid': str(uuid.uuid4())}
+    for stream in streams:
+        try:
+            render_template(stream.payload, sample_context)
+        except (KeyError, IndexError, ValueError, TypeError, AttributeError) as e:
+            raise ValueError(f"Invalid payload template for {stream.event_type}: {type(e).__name__}: {e}")
+    return streams
 
 # 初始化事件生产者
 producer = EventProducer(BROKER_URL, SOURCE)
 
+# 初始化并启动周期发送器
+emitter = PeriodicEmitter(producer, build_emit_streams(), EMITTER_MODE, EMITTER_LOCK_FILE, EMITTER_MAX_INFLIGHT)
+emitter.start()
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查端点"""
@@ -129,35 +387,72 @@ def produce_event():
             'message': str(e)
         }), 500
 
+def iter_batch_events(count: int, event_type: str, pacing: float = 0.1):
+    """逐个生成并发送批量事件，每发送完一个产出 (event_id, success)；pacing 为相邻事件的间隔（秒）"""
+    for i in range(count):
+        event_data = {
+            'message': f'Batch event {i+1} of {count}',
+            'timestamp': datetime.utcnow().isoformat(),
+            'counter': producer.event_counter + 1,
+            'batch_id': str(uuid.uuid4()),
+            'index': i + 1,
+            'total': count
+        }
+        
+        event = producer.create_event(event_type, event_data)
+        success = producer.send_event(event)
+        
+        yield event['id'], success
+        
+        # 小延迟避免过载
+        if pacing:
+            time.sleep(pacing)
+
+def stream_batch_events(count: int, event_type: str):
+    """
+    以 NDJSON 流式返回批量结果：每个事件一行，最后一行为汇总
+    不再额外间隔：同步发送和客户端读取本身形成背压。大批量的流式响应可能超过 gunicorn 的 --timeout，
+    需使用 gthread 等由主循环上报心跳的 worker（见 Dockerfile），sync worker 会在流式响应中途被杀掉
+    """
+    successful_events = 0
+    sent = 0
+    try:
+        for index, (event_id, success) in enumerate(iter_batch_events(count, event_type, pacing=0), start=1):
+            sent = index
+            successful_events += success
+            yield json.dumps({'index': index, 'event_id': event_id, 'success': success}) + '\n'
+        status = 'completed'
+    except Exception as e:
+        logger.error(f"Error in streaming batch: {str(e)}")
+        status = 'error'
+    
+    yield json.dumps({
+        'status': status,
+        'total_events': count,
+        'sent_events': sent,
+        'successful_events': successful_events,
+        'failed_events': sent - successful_events
+    }) + '\n'
+
 @app.route('/produce/batch', methods=['POST'])
 def produce_batch_events():
-    """批量生成事件端点"""
+    """
+    批量生成事件端点
+    请求体 stream=true 或 Accept: application/x-ndjson 时流式返回每个事件的结果，
+    内存占用与 count 无关
+    """
     try:
         request_data = request.get_json() or {}
         count = request_data.get('count', 5)
         event_type = request_data.get('type', EVENT_TYPE)
         
-        results = []
-        for i in range(count):
-            event_data = {
-                'message': f'Batch event {i+1} of {count}',
-                'timestamp': datetime.utcnow().isoformat(),
-                'counter': producer.event_counter + 1,
-                'batch_id': str(uuid.uuid4()),
-                'index': i + 1,
-                'total': count
-            }
-            
-            event = producer.create_event(event_type, event_data)
-            success = producer.send_event(event)
-            
-            results.append({
-                'event_id': event['id'],
-                'success': success
-            })
-            
-            # 小延迟避免过载
-            time.sleep(0.1)
+        if request_data.get('stream') or request.accept_mimetypes.best == 'application/x-ndjson':
+            return Response(stream_batch_events(count, event_type), mimetype='application/x-ndjson')
+        
+        results = [
+            {'event_id': event_id, 'success': success}
+            for event_id, success in iter_batch_events(count, event_type)
+        ]
         
         successful_events = sum(1 for r in results if r['success'])
         
@@ -183,9 +478,27 @@ def metrics():
         'events_produced': producer.event_counter,
         'broker_url': producer.broker_url,
         'source': producer.source,
-        'uptime': time.time()
+        'uptime': time.time(),
+        'emitter': emitter.snapshot(),
+        'tracing': tracer.snapshot()
     })
 
+@app.route('/emitter', methods=['GET'])
+def emitter_status():
+    """周期发送器状态"""
+    return jsonify(emitter.snapshot())
+
+# ==================== 调试与性能分析 ====================
+# 设置 DEBUG_TOKEN 后启用 /debug/* 端点，请求需携带 Authorization: Bearer <DEBUG_TOKEN>（见 shared/debug.py）
+
+# 需要计时的热路径
+HOT_PATH_TARGETS = [
+    ('send_event', producer, 'send_event'),
+    ('to_structured', sys.modules[__name__], 'to_structured')
+]
+
+debug_sync = install_debug_endpoints(app, 'event-producer', HOT_PATH_TARGETS)
+
 if __name__ == '__main__':
     logger.info(f"Starting Event Producer Service on port {PORT}")
     logger.info(f"Broker URL: {BROKER_URL}")
@@ -0,0 +1,3 @@
+"""
+producer 与 consumer 共用的调试、性能分析与追踪工具
+"""
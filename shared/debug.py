@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+调试与性能分析工具
+热路径计时、GC 停顿统计、采样 profiler，以及对应的 /debug/* 端点。
+设置 DEBUG_TOKEN 后启用端点，请求需携带 Authorization: Bearer <DEBUG_TOKEN>。
+
+gunicorn 多 worker 部署时，各 worker 的统计状态相互独立，而请求会落在任意一个 worker 上：
+处理 POST 的 worker 把期望状态写入 DEBUG_STATE_DIR 下的 control.json，
+每个 worker 的后台线程定期读取并应用，同时把自己的统计写入 worker-<pid>.json，
+GET 汇总所有存活 worker 的结果（按 pid 分组，profile 的 collapsed stacks 合并计数）。
+"""
+
+import os
+import gc
+import sys
+import hmac
+import json
+import time
+import uuid
+import fcntl
+import logging
+import tempfile
+import threading
+import functools
+import tracemalloc
+from collections import Counter, deque
+from typing import Dict, Any, Optional
+
+from flask import Response, request, jsonify
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MAX_SECONDS = 25  # 低于 gunicorn 超时
+
+class HotPathTimer:
+    """
+    热路径计时
+    启用时把目标函数替换为计时包装，关闭时恢复原函数，因此关闭状态下热路径没有任何额外开销
+    """
+
+    def __init__(self, targets):
+        # targets: [(名称, 所属对象或模块, 属性名)]
+        self.targets = targets
+        self.enabled = False
+        # 名称 -> (原函数, 原函数是否直接保存在对象自身上)
+        self._originals = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _wrap(self, name, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._record(name, time.perf_counter() - started)
+        return wrapper
+
+    def _record(self, name, elapsed):
+        with self._lock:
+            stats = self._stats.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0, 'samples': deque(maxlen=10000)})
+            stats['count'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            stats['samples'].append(elapsed)
+
+    def enable(self):
+        with self._lock:
+            if self.enabled:
+                return
+            for name, owner, attr in self.targets:
+                original = getattr(owner, attr)
+                self._originals[name] = (original, attr in vars(owner))
+                setattr(owner, attr, self._wrap(name, original))
+            self.enabled = True
+
+    def disable(self):
+        with self._lock:
+            if not self.enabled:
+                return
+            for name, owner, attr in self.targets:
+                original, own_attr = self._originals.pop(name)
+                if own_attr:
+                    setattr(owner, attr, original)
+                else:
+                    # 实例方法：删除实例上的包装，恢复为类上的方法
+                    delattr(owner, attr)
+            self.enabled = False
+
+    def set_enabled(self, enabled: bool):
+        if enabled:
+            self.enable()
+        else:
+            self.disable()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = {}
+            for name, stats in self._stats.items():
+                samples = sorted(stats['samples'])
+                spans[name] = {
+                    'count': stats['count'],
+                    'mean_ms': round(stats['total'] / stats['count'] * 1000, 3),
+                    'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+                    'p99_ms': round(samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000, 3),
+                    'max_ms': round(stats['max'] * 1000, 3)
+                }
+            return {'enabled': self.enabled, 'spans': spans}
+
+class GCMonitor:
+    """通过 gc.callbacks 统计每代 GC 的停顿时间；可选开启 tracemalloc 统计分配热点"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._started = None
+        self._pauses = {}
+
+    def _callback(self, phase, info):
+        if phase == 'start':
+            self._started = time.perf_counter()
+        elif self._started is not None:
+            pause = time.perf_counter() - self._started
+            self._started = None
+            with self._lock:
+                stats = self._pauses.setdefault(info['generation'], {
+                    'collections': 0, 'total_pause_ms': 0.0, 'max_pause_ms': 0.0, 'collected': 0, 'uncollectable': 0
+                })
+                stats['collections'] += 1
+                stats['total_pause_ms'] += pause * 1000
+                stats['max_pause_ms'] = max(stats['max_pause_ms'], pause * 1000)
+                stats['collected'] += info['collected']
+                stats['uncollectable'] += info['uncollectable']
+
+    def set_enabled(self, enabled: bool):
+        if enabled and not self.enabled:
+            gc.callbacks.append(self._callback)
+        elif not enabled and self.enabled:
+            gc.callbacks.remove(self._callback)
+        self.enabled = enabled
+
+    @staticmethod
+    def set_tracemalloc(enabled: bool):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            pauses = {str(gen): {k: round(v, 3) for k, v in stats.items()} for gen, stats in self._pauses.items()}
+        result = {
+            'pause_tracking': self.enabled,
+            'pauses_by_generation': pauses,
+            'gc_counts': gc.get_count(),
+            'gc_thresholds': gc.get_threshold(),
+            'gc_stats': gc.get_stats(),
+            'tracemalloc': tracemalloc.is_tracing()
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+            result['allocations'] = {
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'top': [{'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count} for stat in top]
+            }
+        return result
+
+class SamplingProfiler:
+    """
+    后台线程定时采样所有线程的调用栈，输出 flamegraph.pl / speedscope 可用的 collapsed stacks
+    采样在独立线程中进行，gunicorn sync worker 在采样期间仍可继续处理请求
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.profile_id = None
+        self.result = None
+        self.samples = 0
+        self.status = 'idle'
+
+    def start(self, seconds: float, interval: float, profile_id: Optional[str] = None) -> bool:
+        with self._lock:
+            if self.status == 'running':
+                return False
+            self.status = 'running'
+            self.profile_id = profile_id
+            self.result = None
+        self._thread = threading.Thread(target=self._run, args=(seconds, interval), name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, seconds, interval):
+        me = threading.get_ident()
+        counts = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                counts[';'.join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(interval)
+        with self._lock:
+            self.result = '\n'.join(f"{stack} {count}" for stack, count in counts.most_common()) + '\n'
+            self.samples = samples
+            self.status = 'done'
+
+class WorkerSync:
+    """
+    同一容器内各 worker 之间的调试状态同步（基于 state_dir 下的文件）
+    control.json 保存期望状态，读改写时持有 control.lock 文件锁；
+    worker-<pid>.json 是各 worker 最近一次上报的统计，超过 3 个同步周期未更新的视为已退出；
+    profile-<id>-<pid>.json 是各 worker 的采样结果
+    """
+
+    def __init__(self, state_dir: str, timer: HotPathTimer, gc_monitor: GCMonitor,
+                 profiler: SamplingProfiler, interval: float = 1.0):
+        self.state_dir = state_dir
+        self.timer = timer
+        self.gc_monitor = gc_monitor
+        self.profiler = profiler
+        self.interval = interval
+        self.pid = os.getpid()
+        self._control_path = os.path.join(state_dir, 'control.json')
+        self._lock_path = os.path.join(state_dir, 'control.lock')
+        self._applied_mtime = None
+        self._applied_reset = 0
+        self._started_profiles = set()
+        self._written_profiles = set()
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+
+    def start(self):
+        threading.Thread(target=self._loop, name='debug-sync', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning(f"Debug state sync failed: {str(e)}")
+
+    def _write_json(self, path: str, data: Dict[str, Any]):
+        # 先写临时文件再 rename，读取方不会看到写了一半的文件
+        tmp_path = f"{path}.{self.pid}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def control(self) -> Dict[str, Any]:
+        return self._read_json(self._control_path) or {}
+
+    def update(self, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """合并写入期望状态并立即在当前 worker 上应用；返回更新后的 control"""
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            control = self.control()
+            if changes.pop('timing_reset', False):
+                control['timing_reset'] = control.get('timing_reset', 0) + 1
+            control.update(changes)
+            self._write_json(self._control_path, control)
+        self.sync()
+        return control
+
+    def sync(self):
+        """应用 control.json 中的期望状态，并上报当前 worker 的统计"""
+        with self._lock:
+            self._apply()
+            self._publish()
+
+    def _apply(self):
+        try:
+            mtime = os.stat(self._control_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime != self._applied_mtime:
+            control = self.control()
+            if 'timing' in control:
+                self.timer.set_enabled(control['timing'])
+            if control.get('timing_reset', 0) > self._applied_reset:
+                self.timer.reset()
+                self._applied_reset = control['timing_reset']
+            if 'gc' in control:
+                self.gc_monitor.set_enabled(control['gc'])
+            if 'tracemalloc' in control:
+                self.gc_monitor.set_tracemalloc(control['tracemalloc'])
+            profile = control.get('profile')
+            # 只启动尚未过期的采样，避免重启后的 worker 按旧的 control.json 重新采样
+            if profile and profile['id'] not in self._started_profiles and time.time() < profile['deadline']:
+                self._started_profiles.add(profile['id'])
+                self.profiler.start(profile['deadline'] - time.time(), profile['interval'], profile['id'])
+            self._applied_mtime = mtime
+
+        profile_id = self.profiler.profile_id
+        if self.profiler.status == 'done' and profile_id and profile_id not in self._written_profiles:
+            self._written_profiles.add(profile_id)
+            self._write_json(os.path.join(self.state_dir, f'profile-{profile_id}-{self.pid}.json'), {
+                'pid': self.pid, 'samples': self.profiler.samples, 'stacks': self.profiler.result
+            })
+
+    def _publish(self):
+        self._write_json(os.path.join(self.state_dir, f'worker-{self.pid}.json'), {
+            'pid': self.pid,
+            'updated_at': time.time(),
+            'timing': self.timer.snapshot(),
+            'gc': self.gc_monitor.snapshot()
+        })
+
+    def workers(self) -> Dict[str, Dict[str, Any]]:
+        """各存活 worker 最近上报的统计，按 pid 索引"""
+        workers = {}
+        cutoff = time.time() - 3 * self.interval
+        for name in os.listdir(self.state_dir):
+            if name.startswith('worker-') and name.endswith('.json'):
+                data = self._read_json(os.path.join(self.state_dir, name))
+                if data and data['updated_at'] >= cutoff:
+                    workers[str(data['pid'])] = data
+        return workers
+
+    def clear_profiles(self):
+        """删除之前各次采样的结果文件"""
+        for name in os.listdir(self.state_dir):
+            if name.startswith('profile-') and name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.state_dir, name))
+                except OSError:
+                    pass
+
+    def profile_results(self, profile_id: str) -> Dict[str, Dict[str, Any]]:
+        prefix = f'profile-{profile_id}-'
+        results = {}
+        for name in os.listdir(self.state_dir):
+            if name.startswith(prefix) and name.endswith('.json'):
+                data = self._read_json(os.path.join(self.state_dir, name))
+                if data:
+                    results[str(data['pid'])] = data
+        return results
+
+def debug_endpoint(token: str):
+    """未设置 token 时端点不存在；设置后校验 Bearer token"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not token:
+                return jsonify({'error': 'Not found'}), 404
+            auth = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(auth.encode(), f'Bearer {token}'.encode()):
+                return jsonify({'error': 'Unauthorized'}), 401
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def merge_collapsed_stacks(texts) -> str:
+    counts = Counter()
+    for text in texts:
+        for line in text.splitlines():
+            stack, _, count = line.rpartition(' ')
+            if stack:
+                counts[stack] += int(count)
+    return '\n'.join(f"{stack} {count}" for stack, count in counts.most_common()) + '\n'
+
+def install_debug_endpoints(app, service: str, hot_path_targets) -> WorkerSync:
+    """
+    注册 /debug/profile、/debug/timing、/debug/gc
+    环境变量: DEBUG_TOKEN（为空时端点返回 404，也不启动同步线程）、
+    DEBUG_STATE_DIR（默认 <临时目录>/<service>-debug，同一容器内的 worker 必须指向同一目录）
+    """
+    token = os.getenv('DEBUG_TOKEN', '')
+    state_dir = os.getenv('DEBUG_STATE_DIR', os.path.join(tempfile.gettempdir(), f'{service}-debug'))
+    sync = WorkerSync(state_dir, HotPathTimer(hot_path_targets), GCMonitor(), SamplingProfiler())
+    if token:
+        sync.start()
+
+    def per_worker(key: str) -> Dict[str, Any]:
+        sync.sync()
+        return {
+            'pid': sync.pid,
+            'workers': {pid: data[key] for pid, data in sync.workers().items()}
+        }
+
+    @app.route('/debug/profile', methods=['GET', 'POST'])
+    @debug_endpoint(token)
+    def debug_profile():
+        """
+        POST 在所有 worker 上启动限时采样（seconds、interval_ms），返回 profile_id；
+        GET 在所有 worker 完成后返回合并的 collapsed stacks（可用 ?id= 指定 profile_id，默认最近一次）
+        """
+        if request.method == 'POST':
+            params = request.get_json(silent=True) or {}
+            seconds = min(float(params.get('seconds', 10)), PROFILE_MAX_SECONDS)
+            interval = max(float(params.get('interval_ms', 10)), 1) / 1000
+            profile = sync.control().get('profile')
+            if profile and time.time() < profile['deadline']:
+                return jsonify({'error': 'Profile already running', 'profile_id': profile['id']}), 409
+            sync.clear_profiles()
+            profile_id = uuid.uuid4().hex[:12]
+            sync.update({'profile': {'id': profile_id, 'deadline': time.time() + seconds, 'interval': interval}})
+            return jsonify({
+                'status': 'running', 'profile_id': profile_id, 'seconds': seconds,
+                'interval_ms': interval * 1000, 'pid': sync.pid
+            }), 202
+
+        sync.sync()
+        profile = sync.control().get('profile')
+        profile_id = request.args.get('id') or (profile and profile['id'])
+        if not profile_id:
+            return jsonify({'status': 'idle', 'pid': sync.pid}), 200
+        results = sync.profile_results(profile_id)
+        pending = sorted(set(sync.workers()) - set(results))
+        # 采样结束后再留 2 个同步周期让各 worker 写出结果
+        if pending and profile and profile['id'] == profile_id and time.time() < profile['deadline'] + 2 * sync.interval:
+            return jsonify({'status': 'running', 'profile_id': profile_id, 'workers_done': sorted(results),
+                            'workers_pending': pending, 'pid': sync.pid}), 202
+        if not results:
+            return jsonify({'error': 'Profile not found', 'profile_id': profile_id}), 404
+        return Response(
+            merge_collapsed_stacks(r['stacks'] for r in results.values()),
+            mimetype='text/plain',
+            headers={
+                'X-Profile-Samples': str(sum(r['samples'] for r in results.values())),
+                'X-Profile-Workers': ','.join(sorted(results))
+            }
+        )
+
+    @app.route('/debug/timing', methods=['GET', 'POST'])
+    @debug_endpoint(token)
+    def debug_timing():
+        """POST {"enabled": true/false, "reset": true} 在所有 worker 上切换热路径计时，GET 按 worker 查看各 span 统计"""
+        if request.method == 'POST':
+            params = request.get_json(silent=True) or {}
+            changes = {}
+            if params.get('reset'):
+                changes['timing_reset'] = True
+            if 'enabled' in params:
+                changes['timing'] = bool(params['enabled'])
+            sync.update(changes)
+        return jsonify(per_worker('timing'))
+
+    @app.route('/debug/gc', methods=['GET', 'POST'])
+    @debug_endpoint(token)
+    def debug_gc():
+        """POST {"enabled": true, "tracemalloc": true} 在所有 worker 上开启 GC 停顿与分配统计，GET 按 worker 查看"""
+        if request.method == 'POST':
+            params = request.get_json(silent=True) or {}
+            changes = {}
+            if 'enabled' in params:
+                changes['gc'] = bool(params['enabled'])
+            if 'tracemalloc' in params:
+                changes['tracemalloc'] = bool(params['tracemalloc'])
+            sync.update(changes)
+        return jsonify(per_worker('gc'))
+
+    return sync
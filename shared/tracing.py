@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+轻量级分布式追踪
+通过 CloudEvents 分布式追踪扩展属性 traceparent（W3C Trace Context）串联 producer → broker → consumer，
+span 以批次导出到本地文件（NDJSON）或 collector（见 benchmarks/trace_collector.py）。
+"""
+
+import json
+import time
+import random
+import logging
+import threading
+import urllib.request
+from collections import deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class Tracer:
+    """
+    轻量级追踪器
+    span 写入定长 deque 组成的环形缓冲区，缓冲区满时丢弃最旧的 span；后台线程按批次导出到本地文件（NDJSON）或 collector。
+    写入、取批和计数器更新共用一把小锁，锁内只有 deque 操作和整数加法（只在被采样的 span 上发生），
+    保证 recorded = exported + failed + dropped + buffered（导出中的批次除外）。
+    这里有意不用无锁环形缓冲区：请求线程、周期发送线程和导出线程会同时写入和取批，
+    deque(maxlen) 满时静默淘汰旧 span，不加锁就无法准确计入 dropped，取批和计数器也会不一致。
+    锁只在被采样的 span 上获取，未采样或追踪关闭时热路径不加锁
+    """
+
+    def __init__(self, service: str, sample_rate: float, export_file: str, export_url: str,
+                 buffer_size: int, export_interval: float, batch_size: int = 512):
+        self.service = service
+        self.sample_rate = sample_rate
+        self.export_file = export_file
+        self.export_url = export_url
+        self.export_interval = export_interval
+        self.batch_size = batch_size
+        self.enabled = bool(export_file or export_url)
+        self._buffer = deque(maxlen=buffer_size)
+        self.recorded = 0
+        self.exported = 0
+        self.failed = 0
+        self.dropped = 0
+        self.export_errors = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            threading.Thread(target=self._export_loop, name='trace-exporter', daemon=True).start()
+
+    def start_trace(self):
+        """开始新的 trace，返回 (trace_id, 是否采样)；采样在 trace 起点一次性决定"""
+        sampled = self.enabled and random.random() < self.sample_rate
+        return '%032x' % random.getrandbits(128), sampled
+
+    @staticmethod
+    def new_span_id() -> str:
+        return '%016x' % random.getrandbits(64)
+
+    @staticmethod
+    def format_traceparent(trace_id: str, span_id: str, sampled: bool) -> str:
+        return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+    @staticmethod
+    def parse_traceparent(value: Optional[str]):
+        """解析 traceparent，返回 (trace_id, parent_span_id, 是否采样)；格式不合法时返回 None"""
+        if not value:
+            return None
+        parts = value.strip().split('-')
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[0] == 'ff':
+            return None
+        try:
+            flags = int(parts[3], 16)
+        except ValueError:
+            return None
+        return parts[1], parts[2], bool(flags & 1)
+
+    def record(self, trace_id: str, span_id: str, parent_span_id: Optional[str], name: str,
+               start_time: float, duration: float, attributes: Optional[Dict[str, Any]] = None):
+        """记录一个已结束的 span（start_time 为 Unix 时间戳，duration 为秒）"""
+        span = {
+            'trace_id': trace_id,
+            'span_id': span_id,
+            'parent_span_id': parent_span_id,
+            'name': name,
+            'service': self.service,
+            'start_time': start_time,
+            'duration_ms': round(duration * 1000, 3),
+            'attributes': attributes or {}
+        }
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(span)
+            self.recorded += 1
+
+    def _drain(self) -> list:
+        with self._lock:
+            return [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+
+    def _export(self, batch: list):
+        if self.export_url:
+            request_body = json.dumps({'spans': batch}).encode()
+            req = urllib.request.Request(self.export_url, data=request_body,
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+            with urllib.request.urlopen(req, timeout=5):
+                pass
+        else:
+            with open(self.export_file, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(span) + '\n' for span in batch))
+
+    def _export_loop(self):
+        while True:
+            time.sleep(self.export_interval)
+            batch = self._drain()
+            while batch:
+                try:
+                    self._export(batch)
+                    with self._lock:
+                        self.exported += len(batch)
+                except Exception as e:
+                    with self._lock:
+                        self.failed += len(batch)
+                        self.export_errors += 1
+                    logger.warning(f"Failed to export {len(batch)} spans: {str(e)}")
+                batch = self._drain() if len(batch) == self.batch_size else []
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'sample_rate': self.sample_rate,
+                'recorded_spans': self.recorded,
+                'exported_spans': self.exported,
+                'buffered_spans': len(self._buffer),
+                # 缓冲区溢出被覆盖的 span
+                'dropped_spans': self.dropped,
+                'failed_spans': self.failed,
+                'export_errors': self.export_errors
+            }